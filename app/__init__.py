@@ -27,6 +27,12 @@ def create_app(config_class=Config):
     # Initialize database
     db.init_app(app)
 
+    # Databases created by an earlier version lack columns the models now have
+    if app.config['SCHEMA_AUTO_UPGRADE']:
+        from schema import upgrade_schema
+        with app.app_context():
+            upgrade_schema()
+
     # Initialize login manager
     login_manager = LoginManager()
     login_manager.init_app(app)
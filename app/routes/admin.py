@@ -3,12 +3,15 @@ import traceback
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import wraps
 
-from models import db, Quiz, Question, TestCase, Submission, QuestionOption
+from models import db, Quiz, Question, TestCase, QuestionOption, RescoreRun
 from forms import (QuizForm, CodeQuestionForm, TestCaseForm, 
                   MultipleChoiceQuestionForm, TrueFalseQuestionForm, OptionForm)
+from utils import get_scheduler
+from grading import start_rescore
+from results import SubmissionResults, SubmissionFilters, list_submissions, count_submissions, question_counts
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -29,13 +32,18 @@ def allowed_file(filename):
 @admin_required
 def dashboard():
     quizzes = Quiz.query.filter_by(author_id=current_user.id).all()
-    recent_submissions = Submission.query.filter(
-        Submission.quiz_id.in_([q.id for q in quizzes])
-    ).order_by(Submission.completed_at.desc()).limit(10).all()
+    recent_submissions, _ = list_submissions(current_user.id, limit=10)
+    submission_count = count_submissions(
+        current_user.id, SubmissionFilters(date_from=datetime.utcnow() - timedelta(days=30))
+    )
     
     return render_template('admin/dashboard.html', 
                           quizzes=quizzes, 
+                          question_counts=question_counts([quiz.id for quiz in quizzes]),
                           recent_submissions=recent_submissions,
+                          submission_count=submission_count,
+                          execution_queue=get_scheduler().node_stats(),
+                          execution_limiter=get_scheduler().node_limiter_stats(),
                           title='Admin Dashboard')
 
 @admin_bp.route('/quizzes', methods=['GET'])
@@ -82,12 +90,25 @@ def edit_quiz(quiz_id):
         return redirect(url_for('admin.quizzes'))
     
     questions = quiz.questions.order_by(Question.order).all()
+    rescore_run = RescoreRun.query.filter_by(quiz_id=quiz.id).order_by(RescoreRun.id.desc()).first()
     return render_template('admin/quiz_form.html', 
                           form=form, 
                           quiz=quiz, 
                           questions=questions,
+                          rescore_run=rescore_run,
                           title='Edit Quiz')
 
+@admin_bp.route('/quizzes/<int:quiz_id>/rescore', methods=['POST'])
+@admin_required
+def rescore_quiz(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    if quiz.author_id != current_user.id:
+        abort(403)
+    
+    start_rescore(current_app._get_current_object(), quiz)
+    flash('Rescoring submissions. Progress is shown below.', 'info')
+    return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
+
 @admin_bp.route('/quizzes/<int:quiz_id>/delete', methods=['POST'])
 @admin_required
 def delete_quiz(quiz_id):
@@ -127,6 +148,7 @@ def create_code_question(quiz_id):
             problem_statement=form.problem_statement.data,
             starter_code=form.starter_code.data,
             language=form.language.data,
+            grading_policy=form.grading_policy.data,
             question_type='code',
             points=form.points.data,
             order=form.order.data
@@ -167,6 +189,7 @@ def edit_question(quiz_id, question_id):
             question.problem_statement = form.problem_statement.data
             question.starter_code = form.starter_code.data
             question.language = form.language.data
+            question.grading_policy = form.grading_policy.data
             question.points = form.points.data
             question.order = form.order.data
             question.question_type = 'code'  # Ensure type is set
@@ -384,11 +407,11 @@ def edit_multiple_choice_question(quiz_id, question_id):
             question.order = int(order)
             print(f"Updated question fields: {question.title}")
             
-            # Delete all existing options first
-            for option in question.options.all():
-                db.session.delete(option)
-            db.session.flush()
-            print("Deleted all existing options")
+            # Existing options are kept (matched by text) so that students'
+            # selections still refer to them and can be rescored
+            existing_options = {}
+            for option in question.options.order_by(QuestionOption.order, QuestionOption.id):
+                existing_options.setdefault(option.text, []).append(option)
             
             # Process and create new options from form data
             option_count = 0
@@ -441,17 +464,26 @@ def edit_multiple_choice_question(quiz_id, question_id):
                             print(f"Error saving file: {str(e)}")
                             flash(f"Error saving image: {str(e)}", 'warning')
                 
-                # Create new option
-                option = QuestionOption(
-                    question_id=question.id,
-                    text=option_text,
-                    is_correct=is_correct,
-                    order=int(order_value) if order_value else option_count,
-                    image_path=image_path
-                )
-                db.session.add(option)
+                matching_options = existing_options.get(option_text)
+                if matching_options:
+                    # Update the existing option in place
+                    option = matching_options.pop(0)
+                    option.is_correct = is_correct
+                    option.order = int(order_value) if order_value else option_count
+                    if image_path:
+                        option.image_path = image_path
+                else:
+                    # Create new option
+                    option = QuestionOption(
+                        question_id=question.id,
+                        text=option_text,
+                        is_correct=is_correct,
+                        order=int(order_value) if order_value else option_count,
+                        image_path=image_path
+                    )
+                    db.session.add(option)
                 option_count += 1
-                print(f"Added option: {option_text[:20]}...")
+                print(f"Saved option: {option_text[:20]}...")
             
             # Ensure we have at least one option
             if option_count == 0:
@@ -470,9 +502,14 @@ def edit_multiple_choice_question(quiz_id, question_id):
                                     question=question,
                                     title='Edit Multiple Choice Question')
             
+            # Options no longer in the form are removed
+            for options in existing_options.values():
+                for option in options:
+                    db.session.delete(option)
+            
             # Commit the transaction
             db.session.commit()
-            print(f"Successfully committed changes: {option_count} options added")
+            print(f"Successfully committed changes: {option_count} options saved")
             flash('Multiple choice question updated successfully!', 'success')
             return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
             
@@ -648,33 +685,21 @@ def create_test_case(quiz_id, question_id):
     
     form = TestCaseForm()
     
-    if request.method == 'POST':
-        print("\n===== TEST CASE FORM SUBMISSION =====")
-        print(f"Form data: {request.form}")
-        
+    # The form checks the comparator against the registered ones and the
+    # budgets and tolerances; invalid fields are shown with their errors
+    if form.validate_on_submit():
         try:
-            # Process the form manually to better debug issues
-            input_data = request.form.get('input_data', '')
-            expected_output = request.form.get('expected_output', '')
-            is_hidden = 'is_hidden' in request.form
-            order = request.form.get('order', '1')
-            
-            # Validate required fields
-            if not expected_output:
-                flash('Expected output is required.', 'danger')
-                return render_template('admin/test_case_form.html', 
-                                      form=form, 
-                                      quiz=quiz,
-                                      question=question,
-                                      title='Create Test Case')
-            
-            # Create and save the test case
             test_case = TestCase(
                 question_id=question_id,
-                input_data=input_data,
-                expected_output=expected_output,
-                is_hidden=is_hidden,
-                order=int(order)
+                input_data=form.input_data.data or '',
+                expected_output=form.expected_output.data,
+                is_hidden=form.is_hidden.data,
+                order=form.order.data,
+                time_limit=form.time_limit.data,
+                memory_limit=form.memory_limit.data,
+                comparator=form.comparator.data,
+                abs_tolerance=form.abs_tolerance.data,
+                rel_tolerance=form.rel_tolerance.data
             )
             
             db.session.add(test_case)
@@ -688,9 +713,9 @@ def create_test_case(quiz_id, question_id):
             print(f"Error creating test case: {str(e)}")
             traceback.print_exc()
             flash(f'Error creating test case: {str(e)}', 'danger')
-    
-    # Default value for order
-    form.order.data = question.test_cases.count() + 1
+    elif request.method == 'GET':
+        # Default value for order
+        form.order.data = question.test_cases.count() + 1
     
     return render_template('admin/test_case_form.html', 
                           form=form, 
@@ -710,8 +735,9 @@ def edit_test_case(quiz_id, question_id, test_case_id):
     
     form = TestCaseForm(obj=test_case)
     if form.validate_on_submit():
-        test_case.input_data = form.input_data.data
-        test_case.expected_output = form.expected_output.data
+        test_case.set_content(form.input_data.data, form.expected_output.data)
+        test_case.set_budgets(form.time_limit.data, form.memory_limit.data)
+        test_case.set_comparison(form.comparator.data, form.abs_tolerance.data, form.rel_tolerance.data)
         test_case.is_hidden = form.is_hidden.data
         test_case.order = form.order.data
         
@@ -744,28 +770,40 @@ def delete_test_case(quiz_id, question_id, test_case_id):
 @admin_bp.route('/results')
 @admin_required
 def results():
-    quizzes = Quiz.query.filter_by(author_id=current_user.id).all()
-    submissions = Submission.query.filter(
-        Submission.quiz_id.in_([q.id for q in quizzes])
-    ).order_by(Submission.completed_at.desc()).all()
+    quizzes = Quiz.query.filter_by(author_id=current_user.id).order_by(Quiz.title).all()
+    filters = SubmissionFilters.from_args(request.args)
+    submissions, next_cursor = list_submissions(
+        current_user.id,
+        filters,
+        after=request.args.get('after'),
+        limit=current_app.config['RESULTS_PAGE_SIZE']
+    )
     
     return render_template('admin/results.html', 
                           submissions=submissions,
+                          quizzes=quizzes,
+                          filters=filters,
+                          next_cursor=next_cursor,
+                          is_first_page=not request.args.get('after'),
                           title='Quiz Results')
 
 @admin_bp.route('/submission/<int:submission_id>')
 @admin_required
 def view_submission(submission_id):
-    submission = Submission.query.get_or_404(submission_id)
-    quiz = Quiz.query.get_or_404(submission.quiz_id)
+    # Hidden test results are shown to the quiz author
+    results = SubmissionResults.load(submission_id, visible_only=False)
+    if results is None:
+        abort(404)
     
-    if quiz.author_id != current_user.id:
+    if results.quiz.author_id != current_user.id:
         abort(403)
     
-    question_submissions = submission.question_submissions.all()
-    
     return render_template('admin/submission_detail.html',
-                          submission=submission,
-                          quiz=quiz,
-                          question_submissions=question_submissions,
+                          submission=results.submission,
+                          quiz=results.quiz,
+                          question_submissions=results.answered,
+                          test_results=results.test_results,
+                          selected_options=results.selected,
+                          options=results.options,
+                          pending=results.pending,
                           title='Submission Details')
\ No newline at end of file
@@ -1,9 +1,10 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 
-from models import Submission
-from utils import PistonAPI
+from models import Quiz, Submission, QuestionSubmission, GradingJob, RescoreRun
+from utils import PistonAPI, ExecutionScheduler, get_scheduler
+from grading import ensure_grading_workers
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -19,9 +20,12 @@ def run_code():
     language = data.get('language')
     stdin = data.get('stdin', '')
     
-    result = PistonAPI.execute_code(language, code, stdin)
+    # "Run code" experiments queue behind graded submissions
+    result = PistonAPI.execute_code(language, code, stdin,
+                                    priority=ExecutionScheduler.INTERACTIVE,
+                                    owner=current_user.id)
     
-    return jsonify(result)
+    return jsonify(PistonAPI.truncate_result(result))
 
 @api_bp.route('/time-remaining/<int:submission_id>', methods=['GET'])
 @login_required
@@ -44,3 +48,77 @@ def time_remaining(submission_id):
         'timeRemaining': int(time_remaining),
         'formatted': format_time_remaining(time_remaining)
     })
+
+
+@api_bp.route('/submissions/<int:submission_id>/grading-status', methods=['GET'])
+@login_required
+def grading_status(submission_id):
+    submission = Submission.query.get_or_404(submission_id)
+    
+    if submission.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Make sure someone is draining the queue (e.g. after a restart)
+    ensure_grading_workers(current_app._get_current_object())
+    
+    # Polled every few seconds while a quiz page is open: two queries however many answers there are
+    q_submissions = submission.question_submissions.filter(QuestionSubmission.language.isnot(None)).all()
+    jobs = GradingJob.latest_for([q_submission.id for q_submission in q_submissions])
+    
+    answers = {}
+    for q_submission in q_submissions:
+        job = jobs.get(q_submission.id)
+        pending = job is not None and job.is_pending
+        answers[q_submission.id] = {
+            'question_id': q_submission.question_id,
+            'status': job.status if job else 'done',
+            'pending': pending,
+            # Not final until grading finishes (e.g. hidden test cases still running)
+            'score': None if pending else q_submission.score
+        }
+    
+    return jsonify({
+        'pending': sum(1 for a in answers.values() if a['pending']),
+        'answers': answers
+    })
+
+@api_bp.route('/quizzes/<int:quiz_id>/rescore-status', methods=['GET'])
+@login_required
+def rescore_status(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    
+    if quiz.author_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    run = RescoreRun.query.filter_by(quiz_id=quiz.id).order_by(RescoreRun.id.desc()).first()
+    if run is None:
+        return jsonify({'status': None})
+    
+    return jsonify({
+        'status': run.status,
+        'pending': run.is_pending,
+        'total': run.total,
+        'processed': run.processed,
+        'changed': run.changed,
+        'regraded': run.regraded,
+        'percent': run.percent,
+        'error': run.last_error
+    })
+
+@api_bp.route('/metrics/execution', methods=['GET'])
+@login_required
+def execution_metrics():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    scheduler = get_scheduler()
+    return jsonify({
+        'node': {
+            'queues': scheduler.node_stats(),
+            'limiter': scheduler.node_limiter_stats()
+        },
+        'process': {
+            'queues': scheduler.stats(),
+            'limiter': scheduler.limiter_stats()
+        }
+    })
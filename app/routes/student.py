@@ -1,11 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
-from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 
-from models import db, Quiz, Question, Submission, QuestionSubmission, TestResult, QuestionOption, SelectedOption
+from models import (db, Quiz, Question, Submission, SubmissionProgress, QuestionSubmission, TestCase, TestResult,
+                    QuestionOption, SelectedOption)
 from forms import (CodeSubmissionForm, MultipleChoiceSubmissionForm, TrueFalseSubmissionForm)
-from utils import PistonAPI, format_time_remaining
+from utils import format_time_remaining
+from results import SubmissionResults
+from grading import (grade_code_submission, enqueue_grading, ensure_grading_workers,
+                     finalize_submission, grading_deadline, RETRY)
 
 student_bp = Blueprint('student', __name__, url_prefix='/student')
 
@@ -85,10 +89,7 @@ def take_quiz(quiz_id, submission_id):
     
     if time_remaining <= 0:
         # Time's up - mark as completed
-        submission.is_completed = True
-        submission.completed_at = datetime.utcnow()
-        submission.calculate_score()
-        db.session.commit()
+        finalize_submission(current_app._get_current_object(), submission)
         flash('Time\'s up! Your quiz has been automatically submitted.', 'info')
         return redirect(url_for('student.view_submission', submission_id=submission.id))
     
@@ -99,35 +100,22 @@ def take_quiz(quiz_id, submission_id):
         flash('This quiz has no questions yet.', 'warning')
         return redirect(url_for('student.dashboard'))
     
-    # Get current question (first unanswered or first)
-    current_question = None
-    for question in questions:
-        # Check if this question has already been submitted
-        question_submission = QuestionSubmission.query.filter_by(
-            submission_id=submission.id,
-            question_id=question.id
-        ).first()
-        
-        if not question_submission:
-            current_question = question
-            break
+    # Which questions are answered, loaded once for navigation and progress
+    progress = SubmissionProgress.load(submission, questions)
     
-    if not current_question:
-        # All questions have been answered
-        current_question = questions[0]
+    # Get current question (first unanswered or first)
+    current_question = progress.first_unanswered() or questions[0]
     
     # Check if a specific question was requested
     requested_question_id = request.args.get('question_id', type=int)
     if requested_question_id:
-        requested_question = Question.query.get(requested_question_id)
-        if requested_question and requested_question.quiz_id == quiz_id:
+        requested_question = next((q for q in questions if q.id == requested_question_id), None)
+        if requested_question:
             current_question = requested_question
     
     # Get existing submission for this question if any
-    question_submission = QuestionSubmission.query.filter_by(
-        submission_id=submission.id,
-        question_id=current_question.id
-    ).first()
+    answer_id = progress.answer_id(current_question)
+    question_submission = db.session.get(QuestionSubmission, answer_id) if answer_id else None
     
     # Initialize variables for templates
     code_form = None
@@ -159,67 +147,37 @@ def take_quiz(quiz_id, submission_id):
                 question_submission.submitted_at = datetime.utcnow()
             
             db.session.commit()
+            progress.mark_answered(question_submission)
             
-            # Run test cases
-            test_cases = current_question.test_cases.all()
-            for test_case in test_cases:
-                # Check if we already have a result for this test case
-                test_result = TestResult.query.filter_by(
-                    question_submission_id=question_submission.id,
-                    test_case_id=test_case.id
-                ).first()
-                
-                # Run the test case
-                result = PistonAPI.run_test_case(code_form.language.data, code_form.code.data, test_case)
-                
-                if test_result is None:
-                    test_result = TestResult(
-                        question_submission_id=question_submission.id,
-                        test_case_id=test_case.id,
-                        passed=result['passed'],
-                        output=result['output'],
-                        error=result['error'],
-                        execution_time=result['execution_time']
-                    )
-                    db.session.add(test_result)
-                else:
-                    test_result.passed = result['passed']
-                    test_result.output = result['output']
-                    test_result.error = result['error']
-                    test_result.execution_time = result['execution_time']
-            
-            # Calculate score for this question
-            question_submission.calculate_score()
-            db.session.commit()
+            deadline = grading_deadline(current_app, submission)
+            has_hidden_tests = current_question.test_cases.filter_by(is_hidden=True).count() > 0
+            if current_app.config['GRADING_QUEUE_ENABLED'] and current_app.config['GRADING_TIERED']:
+                # Visible tests now, so the student sees results straight away;
+                # the queued job then only runs the hidden tests (results for
+                # unchanged code are reused) and completes the score
+                outcome = grade_code_submission(question_submission, visible_only=True, deadline=deadline)
+                # Visible tests the backend could not run are retried by the queue too
+                needs_job = has_hidden_tests or outcome == RETRY
+                if needs_job:
+                    enqueue_grading(question_submission, deadline)
+                db.session.commit()
+                if needs_job:
+                    ensure_grading_workers(current_app._get_current_object())
+            elif current_app.config['GRADING_QUEUE_ENABLED']:
+                # Grade in the background; the page polls for the result
+                enqueue_grading(question_submission, deadline)
+                db.session.commit()
+                ensure_grading_workers(current_app._get_current_object())
+            else:
+                grade_code_submission(question_submission, deadline=deadline)
+                db.session.commit()
             
             # Check if all questions have been answered
-            all_answered = True
-            for q in questions:
-                q_submission = QuestionSubmission.query.filter_by(
-                    submission_id=submission.id,
-                    question_id=q.id
-                ).first()
-                if not q_submission:
-                    all_answered = False
-                    break
-            
-            if all_answered:
+            if progress.all_answered:
                 flash('All questions have been answered! You can review your answers or submit the quiz.', 'success')
             else:
                 # Move to next unanswered question
-                next_question = None
-                found_current = False
-                for q in questions:
-                    if found_current:
-                        q_submission = QuestionSubmission.query.filter_by(
-                            submission_id=submission.id,
-                            question_id=q.id
-                        ).first()
-                        if not q_submission:
-                            next_question = q
-                            break
-                    if q.id == current_question.id:
-                        found_current = True
+                next_question = progress.next_unanswered(current_question)
                 
                 if next_question:
                     flash('Your answer has been saved. Moving to the next question.', 'success')
@@ -279,6 +237,7 @@ def take_quiz(quiz_id, submission_id):
                 db.session.add(selected_option)
             
             db.session.commit()
+            progress.mark_answered(question_submission)
             
             # Calculate score
             question_submission.calculate_score()
@@ -287,33 +246,11 @@ def take_quiz(quiz_id, submission_id):
             flash('Your answer has been saved.', 'success')
             
             # Check if all questions have been answered or move to next unanswered
-            all_answered = True
-            for q in questions:
-                q_submission = QuestionSubmission.query.filter_by(
-                    submission_id=submission.id,
-                    question_id=q.id
-                ).first()
-                if not q_submission:
-                    all_answered = False
-                    break
-            
-            if all_answered:
+            if progress.all_answered:
                 flash('All questions have been answered! You can review your answers or submit the quiz.', 'success')
             else:
                 # Move to next unanswered question
-                next_question = None
-                found_current = False
-                for q in questions:
-                    if found_current:
-                        q_submission = QuestionSubmission.query.filter_by(
-                            submission_id=submission.id,
-                            question_id=q.id
-                        ).first()
-                        if not q_submission:
-                            next_question = q
-                            break
-                    if q.id == current_question.id:
-                        found_current = True
+                next_question = progress.next_unanswered(current_question)
                 
                 if next_question:
                     flash('Moving to the next question.', 'success')
@@ -358,6 +295,7 @@ def take_quiz(quiz_id, submission_id):
                 db.session.add(selected_option)
             
             db.session.commit()
+            progress.mark_answered(question_submission)
             
             # Calculate score
             question_submission.calculate_score()
@@ -366,33 +304,11 @@ def take_quiz(quiz_id, submission_id):
             flash('Your answer has been saved.', 'success')
             
             # Check if all questions have been answered or move to next unanswered
-            all_answered = True
-            for q in questions:
-                q_submission = QuestionSubmission.query.filter_by(
-                    submission_id=submission.id,
-                    question_id=q.id
-                ).first()
-                if not q_submission:
-                    all_answered = False
-                    break
-            
-            if all_answered:
+            if progress.all_answered:
                 flash('All questions have been answered! You can review your answers or submit the quiz.', 'success')
             else:
                 # Move to next unanswered question
-                next_question = None
-                found_current = False
-                for q in questions:
-                    if found_current:
-                        q_submission = QuestionSubmission.query.filter_by(
-                            submission_id=submission.id,
-                            question_id=q.id
-                        ).first()
-                        if not q_submission:
-                            next_question = q
-                            break
-                    if q.id == current_question.id:
-                        found_current = True
+                next_question = progress.next_unanswered(current_question)
                 
                 if next_question:
                     flash('Moving to the next question.', 'success')
@@ -414,6 +330,7 @@ def take_quiz(quiz_id, submission_id):
                           submission=submission,
                           QuestionOption=QuestionOption,
                           questions=questions,
+                          progress=progress,
                           current_question=current_question,
                           code_form=code_form,
                           multiple_choice_form=multiple_choice_form,
@@ -439,11 +356,8 @@ def submit_quiz(quiz_id, submission_id):
         flash('This quiz has already been submitted.', 'info')
         return redirect(url_for('student.view_submission', submission_id=submission.id))
     
-    # Mark as completed
-    submission.is_completed = True
-    submission.completed_at = datetime.utcnow()
-    submission.calculate_score()
-    db.session.commit()
+    # Mark as completed once every answer is fully graded
+    finalize_submission(current_app._get_current_object(), submission)
     
     flash('Quiz submitted successfully!', 'success')
     return redirect(url_for('student.view_submission', submission_id=submission.id))
@@ -451,55 +365,33 @@ def submit_quiz(quiz_id, submission_id):
 @student_bp.route('/submissions/<int:submission_id>')
 @login_required
 def view_submission(submission_id):
-    submission = Submission.query.get_or_404(submission_id)
+    results = SubmissionResults.load(submission_id, visible_only=True)
+    if results is None:
+        abort(404)
     
+    submission = results.submission
     if submission.user_id != current_user.id:
         abort(403)
     
-    quiz = Quiz.query.get_or_404(submission.quiz_id)
-    questions = quiz.questions.order_by(Question.order).all()
-    
-    # Get all question submissions
-    question_submissions = {}
-    for q in questions:
-        q_submission = QuestionSubmission.query.filter_by(
-            submission_id=submission.id,
-            question_id=q.id
-        ).first()
-        if q_submission:
-            question_submissions[q.id] = q_submission
-    
-    # Get test results for each question
-    test_results = {}
-    selected_options = {}
-    
-    for q_id, q_submission in question_submissions.items():
-        question = Question.query.get(q_id)
-        
-        if question.question_type == 'code':
-            results = TestResult.query.join(TestCase).filter(
-                TestResult.question_submission_id == q_submission.id,
-                TestCase.is_hidden == False
-            ).all()
-            test_results[q_id] = results
-        elif question.question_type in ['multiple_choice', 'true_false']:
-            selected_opts = [so.option_id for so in q_submission.selected_options]
-            selected_options[q_id] = selected_opts
+    selected_options = {
+        q_id: results.selected_option_ids(q_id) for q_id in results.selected
+    }
     
     return render_template('student/submission_detail.html',
                           submission=submission,
-                          quiz=quiz,
-                          questions=questions,
-                          question_submissions=question_submissions,
-                          test_results=test_results,
+                          quiz=results.quiz,
+                          questions=results.questions,
+                          question_submissions=results.answers,
+                          test_results=results.test_results,
                           selected_options=selected_options,
-                          QuestionOption=QuestionOption,
+                          options=results.options,
+                          pending=results.pending,
                           title='Quiz Results')
 
 @student_bp.route('/results')
 @login_required
 def results():
-    submissions = Submission.query.filter_by(
+    submissions = Submission.query.options(joinedload(Submission.quiz)).filter_by(
         user_id=current_user.id,
         is_completed=True
     ).order_by(Submission.completed_at.desc()).all()
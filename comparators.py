@@ -0,0 +1,202 @@
+import math
+import re
+from collections import Counter
+
+# How much of a differing line or token is quoted in a mismatch message
+SNIPPET_LENGTH = 60
+
+TOKEN_PATTERN = re.compile(r'\S+')
+
+# Absolute tolerance of the float comparator when a test case sets none
+DEFAULT_ABS_TOLERANCE = 1e-6
+
+
+class Mismatch:
+    """Where a program's output first differs from the expected output"""
+    
+    def __init__(self, message, line=None):
+        self.message = message
+        self.line = line
+    
+    def __str__(self):
+        if self.line is None:
+            return self.message
+        return f"Line {self.line}: {self.message}"
+
+
+def _snippet(text):
+    text = text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH] + '...'
+    return repr(text)
+
+
+def _lines(text):
+    """Yield the lines of text one at a time, without splitting all of it up front"""
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def _tokens(text):
+    """Yield (token, line number) for every whitespace-separated token"""
+    line = 1
+    last = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        line += text.count('\n', last, match.start())
+        last = match.start()
+        yield match.group(0), line
+
+
+def _significant_lines(text, normalize):
+    """Normalized lines, with trailing blank lines dropped (they are never significant)"""
+    blank = 0
+    for line in _lines(text):
+        line = normalize(line)
+        if not line:
+            blank += 1
+            continue
+        for _ in range(blank):
+            yield ''
+        blank = 0
+        yield line
+
+
+def _compare_sequences(actual, expected, equal):
+    """Walk two streams of (item, line number) pairs in step, stopping at the first difference"""
+    actual, expected = iter(actual), iter(expected)
+    while True:
+        got_item, got_line = next(actual, (None, None))
+        want_item, want_line = next(expected, (None, None))
+        if got_item is None and want_item is None:
+            return None
+        if want_item is None:
+            return Mismatch(f"unexpected extra output {_snippet(got_item)}", got_line)
+        if got_item is None:
+            return Mismatch(f"output ended early, expected {_snippet(want_item)} "
+                            f"(line {want_line} of the expected output)")
+        if not equal(got_item, want_item):
+            return Mismatch(f"expected {_snippet(want_item)}, got {_snippet(got_item)}", got_line)
+
+
+def _numbered(lines):
+    return ((line, number) for number, line in enumerate(lines, 1))
+
+
+def compare_exact(actual, expected, test_case):
+    """Identical output, ignoring only leading and trailing whitespace of the whole output"""
+    actual, expected = actual.strip(), expected.strip()
+    if actual == expected:
+        return None
+    # Only now look for where they differ
+    return _compare_sequences(_numbered(_lines(actual)), _numbered(_lines(expected)), str.__eq__)
+
+
+def compare_lines(actual, expected, test_case):
+    """Line by line, ignoring trailing whitespace on each line and trailing blank lines"""
+    return _compare_sequences(
+        _numbered(_significant_lines(actual, str.rstrip)),
+        _numbered(_significant_lines(expected, str.rstrip)),
+        str.__eq__
+    )
+
+
+def compare_whitespace(actual, expected, test_case):
+    """Line by line, treating any run of spaces or tabs as one space and ignoring blank lines"""
+    def normalized(text):
+        for number, line in enumerate(_lines(text), 1):
+            line = ' '.join(line.split())
+            if line:
+                yield line, number
+    
+    return _compare_sequences(normalized(actual), normalized(expected), str.__eq__)
+
+
+def compare_tokens(actual, expected, test_case):
+    """The same whitespace-separated tokens in the same order; line breaks do not matter"""
+    return _compare_sequences(_tokens(actual), _tokens(expected), str.__eq__)
+
+
+def _float_equal(test_case):
+    abs_tolerance, rel_tolerance = test_case.abs_tolerance, test_case.rel_tolerance
+    # Only when neither is set: a tolerance of 0 asks for exact numbers
+    if abs_tolerance is None and rel_tolerance is None:
+        abs_tolerance = DEFAULT_ABS_TOLERANCE
+    abs_tolerance = abs_tolerance or 0.0
+    rel_tolerance = rel_tolerance or 0.0
+    
+    def equal(got, want):
+        try:
+            got_value, want_value = float(got), float(want)
+        except ValueError:
+            # Non-numeric tokens (labels, words) must match exactly
+            return got == want
+        if math.isnan(want_value) or math.isinf(want_value):
+            return got_value == want_value or (math.isnan(got_value) and math.isnan(want_value))
+        difference = abs(got_value - want_value)
+        return difference <= abs_tolerance or difference <= rel_tolerance * abs(want_value)
+    
+    return equal
+
+
+def compare_float(actual, expected, test_case):
+    """Token-wise, with numbers equal within the test case's absolute or relative tolerance"""
+    return _compare_sequences(_tokens(actual), _tokens(expected), _float_equal(test_case))
+
+
+def compare_unordered(actual, expected, test_case):
+    """The same lines in any order (trailing whitespace and blank lines ignored)"""
+    remaining = Counter(map(str.rstrip, expected.splitlines()))
+    del remaining['']
+    for number, line in enumerate(_lines(actual), 1):
+        line = line.rstrip()
+        if not line:
+            continue
+        if not remaining[line]:
+            return Mismatch(f"unexpected line {_snippet(line)}", number)
+        remaining[line] -= 1
+    missing = next((line for line, count in remaining.items() if count > 0), None)
+    if missing is not None:
+        return Mismatch(f"missing line {_snippet(missing)}")
+    return None
+
+
+# Comparators by name, as stored in TestCase.comparator. A comparator takes
+# (actual output, expected output, test case) and returns None if the
+# output is accepted, else a Mismatch describing the first difference.
+COMPARATORS = {
+    'exact': compare_exact,
+    'lines': compare_lines,
+    'whitespace': compare_whitespace,
+    'tokens': compare_tokens,
+    'float': compare_float,
+    'unordered': compare_unordered,
+}
+
+DEFAULT_COMPARATOR = 'exact'
+
+
+def register_comparator(name, comparator):
+    """Make a comparator selectable for test cases"""
+    COMPARATORS[name] = comparator
+
+
+def compare_output(actual, test_case):
+    """
+    Check a program's output against a test case's expected output
+    
+    Args:
+        actual (str): The program's stdout
+        test_case (TestCase): Test case model instance
+    
+    Returns:
+        Mismatch: The first difference, or None if the output is accepted
+    """
+    # Identical output is accepted by every comparator
+    if actual == test_case.expected_output:
+        return None
+    comparator = COMPARATORS.get(test_case.comparator or DEFAULT_COMPARATOR, compare_exact)
+    return comparator(actual, test_case.expected_output, test_case)
@@ -2,6 +2,8 @@ import os
 from dotenv import load_dotenv
 import secrets
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -12,6 +14,8 @@ class Config:
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///coding_quiz.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Add tables, columns and indexes missing from an existing database on start
+    SCHEMA_AUTO_UPGRADE = os.environ.get('SCHEMA_AUTO_UPGRADE', 'True').lower() == 'true'
     
     # Security settings
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
@@ -33,45 +37,157 @@ class Config:
     # Logging configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
-    # Piston API settings
+    # Submissions per page on the admin results page
+    RESULTS_PAGE_SIZE = int(os.environ.get('RESULTS_PAGE_SIZE', 50))
+    
+    # Code execution backend: 'piston' (remote Piston API) or 'local' (sandboxed
+    # subprocesses using the interpreters and compilers installed on this host)
+    CODE_EXECUTION_BACKEND = os.environ.get('CODE_EXECUTION_BACKEND', 'piston').lower()
+    
+    # Piston API settings. PISTON_API_URL may list several backends separated
+    # by commas; requests are balanced over the healthy ones.
     PISTON_API_URL = os.environ.get('PISTON_API_URL') or 'https://emkc.org/api/v2/piston'
+    PISTON_API_URLS = [url.strip() for url in PISTON_API_URL.split(',') if url.strip()]
     PISTON_API_TIMEOUT = int(os.environ.get('PISTON_API_TIMEOUT', 10))  # 10 seconds timeout
+    PISTON_POOL_SIZE = int(os.environ.get('PISTON_POOL_SIZE', 16))  # keep-alive connections per worker
+    PISTON_MAX_RETRIES = int(os.environ.get('PISTON_MAX_RETRIES', 2))
+    PISTON_RETRY_BACKOFF = float(os.environ.get('PISTON_RETRY_BACKOFF', 0.25))  # base delay in seconds
+    PISTON_RETRY_BACKOFF_MAX = float(os.environ.get('PISTON_RETRY_BACKOFF_MAX', 2.0))
+    PISTON_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('PISTON_BREAKER_FAILURE_THRESHOLD', 5))
+    PISTON_BREAKER_RESET_TIMEOUT = int(os.environ.get('PISTON_BREAKER_RESET_TIMEOUT', 30))  # seconds
+    PISTON_HEALTH_CHECK_INTERVAL = int(os.environ.get('PISTON_HEALTH_CHECK_INTERVAL', 15))  # seconds, 0 disables
+    PISTON_HEALTH_CHECK_TIMEOUT = int(os.environ.get('PISTON_HEALTH_CHECK_TIMEOUT', 3))  # seconds
+    PISTON_SLOW_START = int(os.environ.get('PISTON_SLOW_START', 30))  # seconds for a recovered backend to reach full weight
+    # Largest run_timeout the backend accepts (its PISTON_RUN_TIMEOUT, 3000 ms by default); longer requests get a 400
+    PISTON_MAX_RUN_TIMEOUT = int(os.environ.get('PISTON_MAX_RUN_TIMEOUT', 3000))  # milliseconds
+    
+    # Runtime catalog: installed language versions fetched from the backend,
+    # used to resolve the versions below and reject missing runtimes locally
+    RUNTIME_CATALOG_ENABLED = os.environ.get('RUNTIME_CATALOG_ENABLED', 'True').lower() == 'true'
+    RUNTIME_CATALOG_REFRESH_INTERVAL = int(os.environ.get('RUNTIME_CATALOG_REFRESH_INTERVAL', 300))  # seconds
+    
+    # Execution result cache (SQLite file shared by every worker on the node)
+    EXECUTION_CACHE_ENABLED = os.environ.get('EXECUTION_CACHE_ENABLED', 'True').lower() == 'true'
+    EXECUTION_CACHE_PATH = os.environ.get('EXECUTION_CACHE_PATH') or os.path.join(basedir, 'instance', 'execution_cache.db')
+    EXECUTION_CACHE_MAX_BYTES = int(os.environ.get('EXECUTION_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64MB
+    EXECUTION_CACHE_TTL = int(os.environ.get('EXECUTION_CACHE_TTL', 24 * 3600))  # 1 day in seconds
+    
+    # Identical executions already in flight are shared instead of repeated
+    EXECUTION_COALESCING_ENABLED = os.environ.get('EXECUTION_COALESCING_ENABLED', 'True').lower() == 'true'
+    EXECUTION_COALESCING_MAX_WAIT = float(os.environ.get('EXECUTION_COALESCING_MAX_WAIT', 30))  # seconds
+    
+    # Execution rate limit shared by all workers on the node (token bucket)
+    EXECUTION_RATE_LIMIT = int(os.environ.get('EXECUTION_RATE_LIMIT', 60))  # executions per minute per language
+    EXECUTION_RATE_LIMIT_BURST = int(os.environ.get('EXECUTION_RATE_LIMIT_BURST', 10))
+    EXECUTION_RATE_LIMIT_MAX_WAIT = float(os.environ.get('EXECUTION_RATE_LIMIT_MAX_WAIT', 15))  # seconds a caller may queue
+    EXECUTION_RATE_LIMIT_MAX_WAITERS = int(os.environ.get('EXECUTION_RATE_LIMIT_MAX_WAITERS', 32))  # per process
+    EXECUTION_RATE_LIMIT_PATH = os.environ.get('EXECUTION_RATE_LIMIT_PATH') or os.path.join(basedir, 'instance', 'execution_state.db')
+    
+    # Execution scheduler: per-process concurrency cap, graded submissions are
+    # served before interactive "Run code" requests, round-robin per student.
+    # The cap adapts (AIMD) between MIN and MAX to keep backend latency under target.
+    EXECUTION_MAX_CONCURRENT = int(os.environ.get('EXECUTION_MAX_CONCURRENT', 16))
+    EXECUTION_MIN_CONCURRENT = int(os.environ.get('EXECUTION_MIN_CONCURRENT', 1))
+    EXECUTION_INITIAL_CONCURRENT = int(os.environ.get('EXECUTION_INITIAL_CONCURRENT', 4))
+    EXECUTION_LATENCY_TARGET = float(os.environ.get('EXECUTION_LATENCY_TARGET', 5))  # seconds per run
+    EXECUTION_MAX_QUEUED_PER_STUDENT = int(os.environ.get('EXECUTION_MAX_QUEUED_PER_STUDENT', 2))  # interactive runs
+    EXECUTION_GRADING_MAX_WAIT = float(os.environ.get('EXECUTION_GRADING_MAX_WAIT', 120))  # seconds
+    EXECUTION_INTERACTIVE_MAX_WAIT = float(os.environ.get('EXECUTION_INTERACTIVE_MAX_WAIT', 15))  # seconds
+    
+    # Local sandbox limits (only used by the 'local' execution backend)
+    # Unprivileged account programs run as; switching to it needs the server to run as root. Without
+    # one, programs run as the server's own user and the backend is only available with FLASK_DEBUG.
+    LOCAL_SANDBOX_USER = os.environ.get('LOCAL_SANDBOX_USER')
+    LOCAL_SANDBOX_MEMORY_LIMIT = int(os.environ.get('LOCAL_SANDBOX_MEMORY_LIMIT', 512))  # MB of address space
+    # Processes of LOCAL_SANDBOX_USER across all concurrent runs (the limit is per user, not per run)
+    LOCAL_SANDBOX_MAX_PROCESSES = int(os.environ.get('LOCAL_SANDBOX_MAX_PROCESSES', 64))
+    LOCAL_SANDBOX_MAX_FILE_SIZE = int(os.environ.get('LOCAL_SANDBOX_MAX_FILE_SIZE', 16))  # MB
+    LOCAL_SANDBOX_TMPDIR = os.environ.get('LOCAL_SANDBOX_TMPDIR')  # defaults to the system temp dir
     
     # Code execution time limits (seconds)
     CODE_EXECUTION_TIMEOUT = int(os.environ.get('CODE_EXECUTION_TIMEOUT', 3))  
     CODE_COMPILE_TIMEOUT = int(os.environ.get('CODE_COMPILE_TIMEOUT', 5))
     
+    # Program I/O limits: larger inputs are rejected, larger outputs are
+    # truncated (with a marker) when stored or shown
+    CODE_MAX_STDIN_SIZE = int(os.environ.get('CODE_MAX_STDIN_SIZE', 1024))  # KB
+    CODE_MAX_OUTPUT_SIZE = int(os.environ.get('CODE_MAX_OUTPUT_SIZE', 64))  # KB
+    
+    # Default number of test cases of one submission graded in parallel
+    # (overridable per language with 'max_concurrency' below)
+    CODE_GRADING_CONCURRENCY = int(os.environ.get('CODE_GRADING_CONCURRENCY', 4))
+    
+    # Grade all test cases of a submission in one execution (compile once, run
+    # many) for languages with a 'batch_harness' in harnesses/
+    CODE_BATCH_EXECUTION = os.environ.get('CODE_BATCH_EXECUTION', 'True').lower() == 'true'
+    
+    # Syntax-check code locally before sending it for execution, for languages
+    # with a 'preflight' checker (see preflight.py); a syntax error is
+    # returned as a compile failure without a backend round-trip
+    EXECUTION_PREFLIGHT_ENABLED = os.environ.get('EXECUTION_PREFLIGHT_ENABLED', 'True').lower() == 'true'
+    EXECUTION_PREFLIGHT_TIMEOUT = float(os.environ.get('EXECUTION_PREFLIGHT_TIMEOUT', 2))  # seconds
+    
+    # Background grading queue for code answers
+    GRADING_QUEUE_ENABLED = os.environ.get('GRADING_QUEUE_ENABLED', 'True').lower() == 'true'
+    GRADING_WORKERS = int(os.environ.get('GRADING_WORKERS', 2))  # in-process worker threads (0 = external workers only)
+    GRADING_JOB_LEASE = int(os.environ.get('GRADING_JOB_LEASE', 120))  # seconds before a running job is reclaimed
+    GRADING_JOB_MAX_ATTEMPTS = int(os.environ.get('GRADING_JOB_MAX_ATTEMPTS', 3))
+    # Tiered grading: visible test cases are graded while the student waits,
+    # hidden ones through the queue. Needs GRADING_QUEUE_ENABLED.
+    GRADING_TIERED = os.environ.get('GRADING_TIERED', 'True').lower() == 'true'
+    GRADING_FINALIZE_TIMEOUT = int(os.environ.get('GRADING_FINALIZE_TIMEOUT', 60))  # seconds to wait for grading on submit
+    # Grading stops this long after a submission's time limit; test cases not
+    # run by then are recorded as deadline exceeded
+    GRADING_DEADLINE_GRACE = int(os.environ.get('GRADING_DEADLINE_GRACE', 30))  # seconds
+    GRADING_POLL_INTERVAL = float(os.environ.get('GRADING_POLL_INTERVAL', 1.0))  # seconds between queue polls when idle
+    # Answers rescored per batch (and per progress update) when a quiz is rescored
+    RESCORE_BATCH_SIZE = int(os.environ.get('RESCORE_BATCH_SIZE', 500))
+    
     # Supported programming languages with version and editor mode
+    # 'version' is the preferred version; it is resolved against the runtime
+    # catalog when the backend has a different one installed
     SUPPORTED_LANGUAGES = {
         'python': {
             'name': 'Python',
             'version': '3.10',
             'mode': 'python',
-            'file_extension': '.py'
+            'file_extension': '.py',
+            'batch_harness': 'batch.py',
+            'preflight': 'python',
+            'max_concurrency': 8
         },
         'c': {
             'name': 'C',
             'version': 'gcc-11.2.0',
             'mode': 'c',
-            'file_extension': '.c'
+            'file_extension': '.c',
+            'batch_harness': 'batch.c',
+            'max_concurrency': 4
         },
         'java': {
             'name': 'Java',
             'version': '17',
             'mode': 'java',
-            'file_extension': '.java'
+            'file_extension': '.java',
+            'batch_harness': 'Batch.java',
+            'max_concurrency': 2
         },
         'javascript': {
             'name': 'JavaScript',
             'version': 'node-18.12.1',
             'mode': 'javascript',
-            'file_extension': '.js'
+            'file_extension': '.js',
+            'batch_harness': 'batch.js',
+            'preflight': 'javascript',
+            'max_concurrency': 8
         },
         'rust': {
             'name': 'Rust',
             'version': '1.65.0',
             'mode': 'rust',
-            'file_extension': '.rs'
+            'file_extension': '.rs',
+            'batch_harness': 'batch.rs',
+            'max_concurrency': 2
         }
     }
     
@@ -1,6 +1,7 @@
+import math
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, PasswordField, BooleanField, IntegerField, SelectField, RadioField, FieldList, FormField, HiddenField, FileField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, Optional
+from wtforms import StringField, TextAreaField, PasswordField, BooleanField, IntegerField, FloatField, SelectField, RadioField, FieldList, FormField, HiddenField, FileField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, Optional, NumberRange
 from flask_wtf.file import FileAllowed
 from models import User
 
@@ -43,6 +44,11 @@ class BaseQuestionForm(FlaskForm):
 class CodeQuestionForm(BaseQuestionForm):
     starter_code = TextAreaField('Starter Code', validators=[Optional()])
     language = SelectField('Language', validators=[DataRequired()])
+    grading_policy = SelectField('Grading Policy', choices=[
+        ('stop_on_compile_error', 'Stop if the program does not compile'),
+        ('stop_on_first_failure', 'Stop at the first failing test case'),
+        ('run_all', 'Always run every test case')
+    ], default='stop_on_compile_error')
     
     def __init__(self, *args, **kwargs):
         super(CodeQuestionForm, self).__init__(*args, **kwargs)
@@ -71,10 +77,46 @@ class TrueFalseQuestionForm(BaseQuestionForm):
         self.question_type.data = 'true_false'
 
 class TestCaseForm(FlaskForm):
+    # Labels of the built-in comparators; others registered in comparators.py are listed by name
+    COMPARATOR_LABELS = {
+        'exact': 'Exact (ignoring leading/trailing whitespace)',
+        'lines': 'Line by line (ignoring trailing spaces)',
+        'whitespace': 'Whitespace-insensitive',
+        'tokens': 'Token by token',
+        'float': 'Numbers within a tolerance',
+        'unordered': 'Same lines in any order'
+    }
+    
     input_data = TextAreaField('Input Data')
     expected_output = TextAreaField('Expected Output', validators=[DataRequired()])
     is_hidden = BooleanField('Hidden Test Case')
     order = IntegerField('Order', validators=[DataRequired()])
+    time_limit = FloatField('CPU Time Budget (seconds)', validators=[Optional(), NumberRange(min=0.001)])
+    memory_limit = IntegerField('Memory Budget (MB)', validators=[Optional(), NumberRange(min=1)])
+    comparator = SelectField('Output Comparison', default='exact')
+    abs_tolerance = FloatField('Absolute Tolerance', validators=[Optional(), NumberRange(min=0)])
+    rel_tolerance = FloatField('Relative Tolerance', validators=[Optional(), NumberRange(min=0)])
+    
+    def __init__(self, *args, **kwargs):
+        super(TestCaseForm, self).__init__(*args, **kwargs)
+        from comparators import COMPARATORS
+        # Only registered comparators can be chosen
+        self.comparator.choices = [(name, self.COMPARATOR_LABELS.get(name, name)) for name in COMPARATORS]
+    
+    def validate_time_limit(self, time_limit):
+        self._check_finite(time_limit)
+    
+    def validate_abs_tolerance(self, abs_tolerance):
+        self._check_finite(abs_tolerance)
+    
+    def validate_rel_tolerance(self, rel_tolerance):
+        self._check_finite(rel_tolerance)
+    
+    @staticmethod
+    def _check_finite(field):
+        # NumberRange lets NaN through, and infinity would disable the check
+        if field.data is not None and not math.isfinite(field.data):
+            raise ValidationError('Please enter a finite number.')
 
 class CodeSubmissionForm(FlaskForm):
     code = TextAreaField('Your Code', validators=[DataRequired()])
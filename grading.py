@@ -0,0 +1,662 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, exists, func, insert, or_, update
+from sqlalchemy.orm import aliased
+
+from models import (db, GradingJob, Question, QuestionOption, QuestionSubmission, RescoreRun, SelectedOption,
+                    Submission, TestCase, TestResult)
+from utils import PistonAPI
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of grade_code_submission
+GRADED = 'graded'
+DEADLINE_EXCEEDED = 'deadline_exceeded'  # some test cases were cut off by the deadline
+RETRY = 'retry'  # the backend was unavailable; some test cases are pending and must be graded again
+
+# What a student sees instead of the backend's own error message
+PENDING_MESSAGE = 'Not graded yet: the code runner is unavailable. Grading will be retried.'
+
+def grading_deadline(app, submission):
+    """Time after which no more of the submission's test cases are run (time limit plus grace)"""
+    return submission.deadline + timedelta(seconds=app.config['GRADING_DEADLINE_GRACE'])
+
+def grade_code_submission(question_submission, visible_only=False, deadline=None):
+    """
+    Run every test case of a code question against the stored answer
+    
+    Writes one TestResult per test case (in test-case order) and updates the
+    question score. Test cases whose stored result was produced from the same
+    code and the same test-case version are not executed again. The caller is
+    responsible for committing, and commits its own changes before calling:
+    nothing may be left to flush while the programs run, since an open write
+    transaction locks the database for every other writer.
+    
+    Args:
+        question_submission (QuestionSubmission): The code answer to grade
+        visible_only (bool): Only run the test cases shown to the student; if
+                             hidden ones are left to run, the question
+                             scores 0 until they have
+        deadline (datetime): Test cases not started by then (UTC) are recorded
+                             as deadline exceeded instead of being run
+    
+    Returns:
+        str: GRADED, DEADLINE_EXCEEDED if some test cases were cut off by the
+             deadline, or RETRY if some could not be run because the backend
+             was unavailable (their results are left pending)
+    """
+    question = question_submission.question
+    test_cases = question.test_cases.order_by(TestCase.order, TestCase.id).all()
+    source_hash = QuestionSubmission.fingerprint(question_submission.language, question_submission.code)
+    
+    # Existing results for this question submission, keyed by test case
+    existing_results = {
+        tr.test_case_id: tr for tr in TestResult.query.filter_by(
+            question_submission_id=question_submission.id
+        ).all()
+    }
+    
+    # Hidden test cases this tier leaves for later (see the score below)
+    hidden_pending = visible_only and any(
+        tc.is_hidden and (tc.id not in existing_results or not existing_results[tc.id].is_current(source_hash, tc))
+        for tc in test_cases
+    )
+    if visible_only:
+        test_cases = [tc for tc in test_cases if not tc.is_hidden]
+    
+    # Only run test cases whose code or data changed since their last result
+    stale_test_cases = [
+        tc for tc in test_cases
+        if tc.id not in existing_results or not existing_results[tc.id].is_current(source_hash, tc)
+    ]
+    
+    policy = question.grading_policy or Question.STOP_ON_COMPILE_ERROR
+    stop_on_compile_error = policy != Question.RUN_ALL_TESTS
+    stop_on_failure = policy == Question.STOP_ON_FIRST_FAILURE
+    
+    # The program compiles the same way whatever the input, so once this code
+    # failed to compile (e.g. in the visible tier) no other test case is run
+    compile_error = next(
+        (tr for tr in existing_results.values() if tr.compile_error and tr.source_hash == source_hash), None
+    )
+    
+    # A result that still stands may already have failed (e.g. a visible test
+    # graded in an earlier tier); nothing after it needs to run
+    runnable_test_cases = stale_test_cases
+    if compile_error is not None:
+        runnable_test_cases = []
+    elif stop_on_failure:
+        stale_ids = {tc.id for tc in stale_test_cases}
+        for index, tc in enumerate(test_cases):
+            test_result = existing_results.get(tc.id)
+            if tc.id not in stale_ids and not test_result.passed and not test_result.is_skipped:
+                runnable_test_cases = [t for t in stale_test_cases if test_cases.index(t) < index]
+                break
+    
+    results = PistonAPI.run_test_cases(
+        question_submission.language,
+        question_submission.code,
+        runnable_test_cases,
+        owner=question_submission.submission.user_id,
+        stop_on_compile_error=stop_on_compile_error,
+        stop_on_failure=stop_on_failure,
+        deadline=deadline.replace(tzinfo=timezone.utc).timestamp() if deadline else None
+    ) if runnable_test_cases else []
+    results.extend([None] * (len(stale_test_cases) - len(runnable_test_cases)))
+    results = dict(zip((tc.id for tc in runnable_test_cases), results))
+    
+    # Failed executions (backend down, rate limited, queue full) say nothing
+    # about the code: those test cases - and anything skipped because of
+    # them - are left pending, without a fingerprint, to be run again
+    failures = [r['error'] for r in results.values() if r is not None and r.get('execution_failed')]
+    execution_failed = bool(failures)
+    if execution_failed:
+        logger.warning(f"Execution failed while grading question submission {question_submission.id}: {failures[0]}")
+    deadline_exceeded = any(r is not None and r.get('deadline_exceeded') for r in results.values())
+    compile_failed = compile_error is not None or any(
+        r is not None and r.get('compile_error') for r in results.values()
+    )
+    skip_reason = (
+        'Not run: the program did not compile' if compile_failed
+        else 'Not run: an earlier test case failed'
+    )
+    
+    # Nothing is written until the programs have run: a pending change would
+    # be flushed by the next query, holding the database's write lock for
+    # as long as the executions take
+    question_submission.source_hash = source_hash
+    
+    # Write results back in test-case order
+    for test_case in stale_test_cases:
+        result = results.get(test_case.id)
+        status = TestResult.COMPLETED
+        if result is not None and result.get('deadline_exceeded'):
+            status = TestResult.DEADLINE_EXCEEDED
+        elif execution_failed and (result is None or result.get('execution_failed')):
+            status = TestResult.PENDING
+            result = {'passed': False, 'output': None, 'error': PENDING_MESSAGE, 'execution_time': 0}
+        elif result is None and compile_error is not None and not stop_on_compile_error:
+            # Every test case is reported under this policy; they all share the compile error
+            result = {'passed': False, 'output': None, 'error': compile_error.error, 'execution_time': 0,
+                      'compile_error': True}
+        elif result is None:
+            status = TestResult.SKIPPED
+            result = {'passed': False, 'output': None, 'error': skip_reason, 'execution_time': 0}
+        test_result = existing_results.get(test_case.id)
+        result_hash = source_hash if status in (TestResult.COMPLETED, TestResult.SKIPPED) else None
+        
+        if test_result is None:
+            test_result = TestResult(
+                question_submission_id=question_submission.id,
+                test_case_id=test_case.id,
+                passed=result['passed'],
+                output=result['output'],
+                error=result['error'],
+                execution_time=result['execution_time'],
+                cpu_time=result.get('cpu_time'),
+                peak_memory=result.get('peak_memory'),
+                status=status,
+                source_hash=result_hash,
+                test_case_version=test_case.version,
+                input_version=test_case.input_version,
+                output_judged=result.get('output_judged', False),
+                compile_error=result.get('compile_error', False)
+            )
+            db.session.add(test_result)
+        else:
+            test_result.passed = result['passed']
+            test_result.output = result['output']
+            test_result.error = result['error']
+            test_result.execution_time = result['execution_time']
+            test_result.cpu_time = result.get('cpu_time')
+            test_result.peak_memory = result.get('peak_memory')
+            test_result.status = status
+            test_result.source_hash = result_hash
+            test_result.test_case_version = test_case.version
+            test_result.input_version = test_case.input_version
+            test_result.output_judged = result.get('output_judged', False)
+            test_result.compile_error = result.get('compile_error', False)
+    
+    # Calculate score for this question. While hidden test cases are still to
+    # run, the question's points are left out rather than scored from the
+    # visible tests alone, which would show full marks and then drop
+    db.session.flush()
+    if hidden_pending:
+        question_submission.score = 0
+    else:
+        question_submission.calculate_score()
+    
+    # Late results still count towards an already finalized quiz
+    submission = question_submission.submission
+    if submission.is_completed:
+        submission.calculate_score()
+
+    if deadline_exceeded:
+        return DEADLINE_EXCEEDED
+    return RETRY if execution_failed else GRADED
+
+def enqueue_grading(question_submission, deadline=None):
+    """
+    Queue a code answer for background grading
+    
+    Any older job for the same answer that has not started yet is superseded,
+    since workers always grade the latest stored code. The caller commits.
+    
+    Args:
+        question_submission (QuestionSubmission): The code answer to grade
+        deadline (datetime): When grading must stop (see grading_deadline)
+    
+    Returns:
+        GradingJob: The new job
+    """
+    GradingJob.query.filter_by(
+        question_submission_id=question_submission.id,
+        status=GradingJob.QUEUED
+    ).update({'status': GradingJob.SUPERSEDED}, synchronize_session=False)
+    
+    job = GradingJob(question_submission_id=question_submission.id, deadline=deadline)
+    db.session.add(job)
+    return job
+
+class GradingWorker:
+    """
+    Drains the grading queue.
+    
+    Jobs are claimed with an atomic conditional UPDATE, so any number of
+    workers (threads or processes) can share the queue. A claimed job holds
+    a lease; if its worker dies the lease expires and another worker picks
+    the job up again. Failed jobs are retried with backoff up to
+    GRADING_JOB_MAX_ATTEMPTS times. Jobs for one answer never run at the
+    same time.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.lease = app.config['GRADING_JOB_LEASE']
+        self.max_attempts = app.config['GRADING_JOB_MAX_ATTEMPTS']
+        self.poll_interval = app.config['GRADING_POLL_INTERVAL']
+    
+    @staticmethod
+    def _claimable(now):
+        # Another job still grading the same answer (e.g. before a resubmission
+        # or a rescore) would write results for the same test cases; its
+        # successor waits until it finishes or its lease expires
+        other = aliased(GradingJob)
+        answer_busy = exists().where(
+            other.question_submission_id == GradingJob.question_submission_id,
+            other.id != GradingJob.id,
+            other.status == GradingJob.RUNNING,
+            other.locked_until >= now
+        )
+        return and_(
+            or_(
+                and_(GradingJob.status == GradingJob.QUEUED, GradingJob.available_at <= now),
+                and_(GradingJob.status == GradingJob.RUNNING, GradingJob.locked_until < now)
+            ),
+            ~answer_busy
+        )
+    
+    def claim(self, job_id, now=None):
+        """Claim a specific job if it is runnable, returning it, or None if someone else has it"""
+        now = now or datetime.utcnow()
+        claimed = db.session.execute(
+            update(GradingJob)
+            .where(GradingJob.id == job_id, self._claimable(now))
+            .values(
+                status=GradingJob.RUNNING,
+                attempts=GradingJob.attempts + 1,
+                started_at=now,
+                locked_until=now + timedelta(seconds=self.lease)
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            job = db.session.get(GradingJob, job_id)
+            db.session.refresh(job)
+            return job
+        return None
+    
+    def claim_next(self):
+        """Claim the oldest runnable job, or return None if the queue is empty"""
+        now = datetime.utcnow()
+        candidates = db.session.query(GradingJob.id).filter(
+            self._claimable(now)
+        ).order_by(GradingJob.id).limit(5).all()
+        
+        for (job_id,) in candidates:
+            job = self.claim(job_id, now)
+            if job is not None:
+                return job
+        return None
+    
+    def process_next(self):
+        """
+        Grade one job from the queue
+        
+        Returns:
+            bool: True if a job was processed, False if the queue was empty
+        """
+        with self.app.app_context():
+            job = self.claim_next()
+            if job is None:
+                return False
+            self.process(job)
+            return True
+            
+    def process(self, job):
+        """Grade a claimed job, scheduling a retry if grading fails"""
+        try:
+            question_submission = db.session.get(QuestionSubmission, job.question_submission_id)
+            outcome = GRADED
+            if question_submission is not None:
+                # Past the deadline this only records what was not run
+                outcome = grade_code_submission(question_submission, deadline=job.deadline)
+            if outcome == RETRY:
+                # The pending results are kept; the job runs again once the
+                # backend is back
+                self.retry(job, 'Execution backend unavailable')
+            else:
+                job.status = GradingJob.DONE if outcome == GRADED else GradingJob.EXPIRED
+                job.finished_at = datetime.utcnow()
+                job.last_error = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Grading job {job.id} failed")
+            job = db.session.get(GradingJob, job.id)
+            self.retry(job, str(e))
+            db.session.commit()
+    
+    def retry(self, job, error):
+        """Put a job back in the queue with backoff, or fail it after GRADING_JOB_MAX_ATTEMPTS"""
+        job.last_error = error
+        if job.attempts >= self.max_attempts:
+            job.status = GradingJob.FAILED
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = GradingJob.QUEUED
+            job.available_at = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+    
+    def run(self, stop_event=None):
+        """Process jobs until stop_event is set"""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                if not self.process_next():
+                    stop_event.wait(self.poll_interval)
+            except Exception:
+                # Keep the worker alive through database hiccups
+                logger.exception("Grading worker error")
+                stop_event.wait(self.poll_interval)
+
+def pending_grading_jobs(submission):
+    """Grading jobs of a submission's answers that have not finished yet"""
+    return GradingJob.query.join(QuestionSubmission).filter(
+        QuestionSubmission.submission_id == submission.id,
+        GradingJob.status.in_(GradingJob.PENDING_STATUSES)
+    ).order_by(GradingJob.id).all()
+
+def finish_pending_grading(app, submission, timeout):
+    """
+    Complete every outstanding grading job of a submission
+    
+    Jobs still waiting in the queue are claimed and graded right here; jobs
+    another worker is already running are waited for, up to timeout seconds.
+    
+    Returns:
+        bool: True if nothing is pending any more
+    """
+    worker = GradingWorker(app)
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = pending_grading_jobs(submission)
+        if not jobs:
+            return True
+        
+        for job in jobs:
+            if job.status == GradingJob.QUEUED:
+                claimed = worker.claim(job.id)
+                if claimed is not None:
+                    worker.process(claimed)
+        
+        if time.monotonic() >= deadline:
+            jobs = pending_grading_jobs(submission)
+            if not jobs:
+                return True
+            # Whatever is still waiting in the queue (e.g. in retry backoff) is
+            # not going to be graded: record its test cases as not run
+            for job in jobs:
+                expired = GradingJob.query.filter_by(id=job.id, status=GradingJob.QUEUED).update(
+                    {'status': GradingJob.EXPIRED, 'finished_at': datetime.utcnow()},
+                    synchronize_session=False
+                )
+                if expired:
+                    grade_code_submission(job.question_submission, deadline=datetime.utcnow())
+            db.session.commit()
+            logger.warning(f"Submission {submission.id} finalized with grading still pending")
+            return False
+        db.session.expire_all()
+        time.sleep(worker.poll_interval)
+
+def finalize_submission(app, submission):
+    """
+    Mark a submission completed with its final score
+    
+    Outstanding grading (e.g. hidden test cases of the last answer) is
+    finished first, but only up to the grading deadline: the score is
+    finalized from the results completed in time. Commits.
+    """
+    until_deadline = (grading_deadline(app, submission) - datetime.utcnow()).total_seconds()
+    finish_pending_grading(app, submission, max(0, min(app.config['GRADING_FINALIZE_TIMEOUT'], until_deadline)))
+    submission.is_completed = True
+    submission.completed_at = datetime.utcnow()
+    submission.calculate_score()
+    db.session.commit()
+
+def _rescore_code_answer(answer, results, test_cases, question_test_cases, updates):
+    """
+    Re-judge a code answer's stale results from their stored output
+    
+    The changed results are appended to updates as rows for a bulk UPDATE.
+    
+    Returns:
+        tuple: (score fraction, whether some result can only be brought up
+               to date by running the code again)
+    """
+    needs_run = False
+    passed = 0
+    for test_result in results:
+        test_case = test_cases.get(test_result.test_case_id)
+        result_passed = test_result.passed
+        if test_case is not None and not test_result.is_current(answer.source_hash, test_case):
+            if test_result.can_rejudge(answer.source_hash, test_case):
+                verdict = PistonAPI.rejudge_test_result(test_result, test_case)
+                result_passed = verdict['passed']
+                updates.append({
+                    'id': test_result.id,
+                    'passed': verdict['passed'],
+                    'error': verdict['error'],
+                    'test_case_version': test_case.version
+                })
+            elif test_result.status != TestResult.DEADLINE_EXCEEDED:
+                needs_run = True
+        passed += 1 if result_passed else 0
+    # Test cases added since the answer was graded have no result yet
+    graded = {tr.test_case_id for tr in results}
+    if not question_test_cases[answer.question_id] <= graded:
+        needs_run = True
+    
+    if not results:
+        return 0, needs_run
+    return passed / len(results), needs_run
+
+def rescore_quiz(app, run, batch_size=None):
+    """
+    Bring every stored score of a quiz up to date with its questions
+    
+    Meant for after an answer key, the points of a question or a test case
+    has changed. The answer keys and test cases are loaded once; answers are
+    then processed in batches of batch_size, each batch with one query for
+    its answers, one for their selected options and one for their test
+    results, and the changed scores written back in bulk. Code results are
+    re-judged from their stored output where only the expected output, the
+    comparator or the budgets changed; answers whose results cannot be (the
+    input changed, or the output was not stored in full) are queued to run
+    again. Submission totals are then updated with one set-based UPDATE.
+    
+    Progress is recorded on run and committed after every batch.
+    
+    Args:
+        app (Flask): The application
+        run (RescoreRun): The run to carry out
+        batch_size (int): Answers per batch (default RESCORE_BATCH_SIZE)
+    """
+    batch_size = batch_size or app.config['RESCORE_BATCH_SIZE']
+    quiz_id = run.quiz_id
+    run.status = RescoreRun.RUNNING
+    
+    questions = {q.id: q for q in Question.query.filter_by(quiz_id=quiz_id)}
+    answer_keys = defaultdict(set)
+    for question_id, option_id in db.session.query(QuestionOption.question_id, QuestionOption.id).filter(
+        QuestionOption.question_id.in_(questions),
+        QuestionOption.is_correct == True
+    ):
+        answer_keys[question_id].add(option_id)
+    test_cases = {tc.id: tc for tc in TestCase.query.filter(TestCase.question_id.in_(questions))}
+    question_test_cases = defaultdict(set)
+    for test_case in test_cases.values():
+        question_test_cases[test_case.question_id].add(test_case.id)
+    
+    answers_query = db.session.query(
+        QuestionSubmission.id,
+        QuestionSubmission.question_id,
+        QuestionSubmission.score,
+        QuestionSubmission.source_hash
+    ).join(Submission).filter(Submission.quiz_id == quiz_id)
+    run.total = answers_query.count()
+    db.session.commit()
+    
+    last_id = 0
+    while True:
+        answers = answers_query.filter(QuestionSubmission.id > last_id).order_by(
+            QuestionSubmission.id
+        ).limit(batch_size).all()
+        if not answers:
+            break
+        last_id = answers[-1].id
+        answer_ids = [answer.id for answer in answers]
+        
+        selected = defaultdict(set)
+        for answer_id, option_id in db.session.query(
+            SelectedOption.question_submission_id, SelectedOption.option_id
+        ).filter(SelectedOption.question_submission_id.in_(answer_ids)):
+            selected[answer_id].add(option_id)
+        
+        results = defaultdict(list)
+        for test_result in TestResult.query.filter(TestResult.question_submission_id.in_(answer_ids)):
+            results[test_result.question_submission_id].append(test_result)
+        
+        scores = []
+        result_updates = []
+        to_regrade = []
+        for answer in answers:
+            question = questions.get(answer.question_id)
+            if question is None:
+                continue
+            if question.question_type == 'code':
+                fraction, needs_run = _rescore_code_answer(
+                    answer, results[answer.id], test_cases, question_test_cases, result_updates
+                )
+                score = fraction * question.points
+                if needs_run:
+                    to_regrade.append(answer.id)
+            elif question.question_type == 'multiple_choice':
+                # All correct options must be selected and no incorrect options
+                score = question.points if selected[answer.id] == answer_keys[question.id] else 0
+            elif question.question_type == 'true_false':
+                score = question.points if selected[answer.id] and selected[answer.id] <= answer_keys[question.id] else 0
+            else:
+                continue
+            if score != answer.score:
+                scores.append({'id': answer.id, 'score': score})
+        
+        if result_updates:
+            db.session.execute(update(TestResult), result_updates)
+        if scores:
+            db.session.execute(update(QuestionSubmission), scores)
+        # The code was submitted in time; it is run again without a deadline
+        if to_regrade and app.config['GRADING_QUEUE_ENABLED']:
+            # As enqueue_grading, for the whole batch at once
+            GradingJob.query.filter(
+                GradingJob.question_submission_id.in_(to_regrade),
+                GradingJob.status == GradingJob.QUEUED
+            ).update({'status': GradingJob.SUPERSEDED}, synchronize_session=False)
+            db.session.execute(insert(GradingJob), [{'question_submission_id': answer_id} for answer_id in to_regrade])
+        elif to_regrade:
+            # The updates above are committed before any code runs
+            db.session.commit()
+            for question_submission in QuestionSubmission.query.filter(QuestionSubmission.id.in_(to_regrade)):
+                grade_code_submission(question_submission)
+        
+        run.processed += len(answers)
+        run.changed += len(scores)
+        run.regraded += len(to_regrade)
+        db.session.commit()
+    
+    # Totals of finished submissions; the rest are totalled when finalized
+    total_points = db.session.query(func.coalesce(func.sum(Question.points), 0)).filter(
+        Question.quiz_id == quiz_id
+    ).scalar()
+    earned_points = db.session.query(func.coalesce(func.sum(QuestionSubmission.score), 0)).filter(
+        QuestionSubmission.submission_id == Submission.id
+    ).scalar_subquery()
+    db.session.execute(
+        update(Submission)
+        .where(Submission.quiz_id == quiz_id, Submission.is_completed == True)
+        .values(score=earned_points, total_points=total_points)
+        .execution_options(synchronize_session=False)
+    )
+    
+    run.status = RescoreRun.DONE
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    if run.regraded:
+        ensure_grading_workers(app)
+    logger.info(f"Rescored quiz {quiz_id}: {run.processed} answers, {run.changed} changed, "
+                f"{run.regraded} queued for grading")
+
+def _run_rescore(app, run_id):
+    with app.app_context():
+        run = db.session.get(RescoreRun, run_id)
+        try:
+            rescore_quiz(app, run)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Rescoring quiz {run.quiz_id} failed")
+            run = db.session.get(RescoreRun, run_id)
+            run.status = RescoreRun.FAILED
+            run.last_error = str(e)
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+
+def start_rescore(app, quiz):
+    """
+    Rescore a quiz in a background thread
+    
+    A run of the same quiz that is still making progress is returned instead
+    of starting another one. Commits.
+    
+    Returns:
+        RescoreRun: The run, whose progress can be polled
+    """
+    stalled_before = datetime.utcnow() - timedelta(seconds=app.config['GRADING_JOB_LEASE'])
+    run = RescoreRun.query.filter(
+        RescoreRun.quiz_id == quiz.id,
+        RescoreRun.status.in_(RescoreRun.PENDING_STATUSES),
+        RescoreRun.updated_at >= stalled_before
+    ).order_by(RescoreRun.id.desc()).first()
+    if run is not None:
+        return run
+    
+    run = RescoreRun(quiz_id=quiz.id)
+    db.session.add(run)
+    db.session.commit()
+    threading.Thread(
+        target=_run_rescore,
+        args=(app, run.id),
+        name=f'rescore-quiz-{quiz.id}',
+        daemon=True
+    ).start()
+    return run
+
+_workers_started = False
+_workers_lock = threading.Lock()
+
+def ensure_grading_workers(app):
+    """
+    Start the in-process grading worker threads once per process
+    
+    Workers are started lazily (on the first enqueue or status poll) rather
+    than in create_app, so CLI commands don't spawn them.
+    """
+    global _workers_started
+    count = app.config['GRADING_WORKERS']
+    if _workers_started or count <= 0 or not app.config['GRADING_QUEUE_ENABLED']:
+        return
+    
+    with _workers_lock:
+        if _workers_started:
+            return
+        for i in range(count):
+            thread = threading.Thread(
+                target=GradingWorker(app).run,
+                name=f'grading-worker-{i}',
+                daemon=True
+            )
+            thread.start()
+        _workers_started = True
+        logger.info(f"Started {count} grading worker threads")
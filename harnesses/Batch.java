@@ -0,0 +1,106 @@
+// Batch harness for Java submissions.
+//
+// Reads the student program and every test input from stdin, compiles the
+// program once and runs it once per input in a fresh JVM, writing one
+// framed record per run to stdout. See PistonAPI.execute_batch for the
+// framing protocol.
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.concurrent.TimeUnit;
+import java.util.regex.Matcher;
+import java.util.regex.Pattern;
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+class Batch {
+    private static String readLine(InputStream in) throws IOException {
+        StringBuilder line = new StringBuilder();
+        int c;
+        while ((c = in.read()) != -1 && c != '\n') {
+            line.append((char) c);
+        }
+        return line.toString().trim();
+    }
+
+    private static byte[] readRecord(InputStream in) throws IOException {
+        int length = Integer.parseInt(readLine(in));
+        return in.readNBytes(length);
+    }
+
+    private static void emit(PrintStream out, String header, byte[]... chunks) throws IOException {
+        out.write((header + "\n").getBytes(StandardCharsets.US_ASCII));
+        for (byte[] chunk : chunks) {
+            out.write(chunk);
+        }
+        out.flush();
+    }
+
+    private static String mainClassName(String source) {
+        Matcher m = Pattern.compile("public\\s+(?:final\\s+)?class\\s+(\\w+)").matcher(source);
+        return m.find() ? m.group(1) : "Main";
+    }
+
+    public static void main(String[] args) throws Exception {
+        long timeoutMs = args.length > 0 ? Long.parseLong(args[0]) : 3000;
+        InputStream in = System.in;
+        PrintStream out = System.out;
+
+        int count = Integer.parseInt(readLine(in));
+        String source = new String(readRecord(in), StandardCharsets.UTF_8);
+        String className = mainClassName(source);
+
+        Path dir = Paths.get("solution");
+        Files.createDirectories(dir);
+        Path sourceFile = dir.resolve(className + ".java");
+        Files.write(sourceFile, source.getBytes(StandardCharsets.UTF_8));
+
+        // Compile once
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        ByteArrayOutputStream compileErr = new ByteArrayOutputStream();
+        int compileCode = compiler.run(null, compileErr, compileErr,
+                "-d", dir.toString(), sourceFile.toString());
+        byte[] errBytes = compileErr.toByteArray();
+        emit(out, "compile " + compileCode + " " + errBytes.length, errBytes);
+        if (compileCode != 0) {
+            return;
+        }
+
+        // Run the compiled class once per input
+        String java = Paths.get(System.getProperty("java.home"), "bin", "java").toString();
+        File input = new File("input.txt");
+        File runOut = new File("run.out");
+        File runErr = new File("run.err");
+        for (int i = 1; i < count; i++) {
+            Files.write(input.toPath(), readRecord(in));
+
+            long start = System.nanoTime();
+            Process process = new ProcessBuilder(java, "-cp", dir.toString(), className)
+                    .redirectInput(input)
+                    .redirectOutput(runOut)
+                    .redirectError(runErr)
+                    .start();
+            String code;
+            String signal = "-";
+            if (process.waitFor(timeoutMs, TimeUnit.MILLISECONDS)) {
+                code = Integer.toString(process.exitValue());
+            } else {
+                process.destroyForcibly().waitFor();
+                code = "-";
+                signal = "SIGKILL";
+            }
+            long elapsedMs = (System.nanoTime() - start) / 1000000;
+
+            byte[] stdout = Files.readAllBytes(runOut.toPath());
+            byte[] stderr = Files.readAllBytes(runErr.toPath());
+            emit(out, "run " + code + " " + signal + " " + elapsedMs + " " + stdout.length + " " + stderr.length,
+                    stdout, stderr);
+        }
+    }
+}
@@ -0,0 +1,174 @@
+/*
+ * Batch harness for C submissions.
+ *
+ * Reads the student program and every test input from stdin, compiles the
+ * program once and runs the binary once per input, writing one framed
+ * record per run to stdout. See PistonAPI.execute_batch for the framing
+ * protocol.
+ */
+#define _GNU_SOURCE
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+static char *read_record(size_t *length)
+{
+    if (scanf("%zu", length) != 1 || getchar() != '\n') {
+        exit(2);
+    }
+    char *data = malloc(*length + 1);
+    if (data == NULL || fread(data, 1, *length, stdin) != *length) {
+        exit(2);
+    }
+    data[*length] = '\0';
+    return data;
+}
+
+static void write_file(const char *path, const char *data, size_t length)
+{
+    FILE *f = fopen(path, "wb");
+    if (f == NULL) {
+        exit(2);
+    }
+    fwrite(data, 1, length, f);
+    fclose(f);
+}
+
+static char *slurp(const char *path, size_t *length)
+{
+    FILE *f = fopen(path, "rb");
+    *length = 0;
+    if (f == NULL) {
+        return calloc(1, 1);
+    }
+    fseek(f, 0, SEEK_END);
+    long size = ftell(f);
+    fseek(f, 0, SEEK_SET);
+    char *data = malloc(size > 0 ? size : 1);
+    *length = fread(data, 1, size, f);
+    fclose(f);
+    return data;
+}
+
+static void redirect(const char *path, int fd, int flags)
+{
+    int file = open(path, flags, 0644);
+    if (file < 0 || dup2(file, fd) < 0) {
+        _exit(127);
+    }
+    close(file);
+}
+
+static double now_ms(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec * 1000.0 + ts.tv_nsec / 1000000.0;
+}
+
+static const char *signal_name(int sig)
+{
+    switch (sig) {
+    case SIGKILL: return "SIGKILL";
+    case SIGSEGV: return "SIGSEGV";
+    case SIGABRT: return "SIGABRT";
+    case SIGFPE: return "SIGFPE";
+    case SIGXCPU: return "SIGXCPU";
+    case SIGBUS: return "SIGBUS";
+    case SIGALRM: return "SIGKILL";
+    default: return "SIGTERM";
+    }
+}
+
+static void emit_record(const char *header, const char *out, size_t out_len,
+                        const char *err, size_t err_len)
+{
+    fputs(header, stdout);
+    fputc('\n', stdout);
+    fwrite(out, 1, out_len, stdout);
+    fwrite(err, 1, err_len, stdout);
+    fflush(stdout);
+}
+
+int main(int argc, char **argv)
+{
+    long timeout_ms = argc > 1 ? atol(argv[1]) : 3000;
+    size_t count, length;
+    char header[128];
+
+    if (scanf("%zu", &count) != 1 || getchar() != '\n' || count == 0) {
+        return 2;
+    }
+
+    char *source = read_record(&length);
+    write_file("solution.c", source, length);
+    free(source);
+
+    /* Compile once */
+    pid_t pid = fork();
+    if (pid == 0) {
+        redirect("compile.out", STDOUT_FILENO, O_WRONLY | O_CREAT | O_TRUNC);
+        redirect("compile.err", STDERR_FILENO, O_WRONLY | O_CREAT | O_TRUNC);
+        execlp("gcc", "gcc", "-O2", "-o", "solution", "solution.c", "-lm", (char *)NULL);
+        _exit(127);
+    }
+    int status = 0;
+    waitpid(pid, &status, 0);
+    int compile_code = WIFEXITED(status) ? WEXITSTATUS(status) : 1;
+
+    size_t err_len;
+    char *err = slurp("compile.err", &err_len);
+    snprintf(header, sizeof(header), "compile %d %zu", compile_code, err_len);
+    emit_record(header, "", 0, err, err_len);
+    free(err);
+    if (compile_code != 0) {
+        return 0;
+    }
+
+    /* Run the binary once per input */
+    for (size_t i = 1; i < count; i++) {
+        char *input = read_record(&length);
+        write_file("input.txt", input, length);
+        free(input);
+
+        double start = now_ms();
+        pid = fork();
+        if (pid == 0) {
+            struct itimerval timer = {{0, 0}, {timeout_ms / 1000, (timeout_ms % 1000) * 1000}};
+            redirect("input.txt", STDIN_FILENO, O_RDONLY);
+            redirect("run.out", STDOUT_FILENO, O_WRONLY | O_CREAT | O_TRUNC);
+            redirect("run.err", STDERR_FILENO, O_WRONLY | O_CREAT | O_TRUNC);
+            setitimer(ITIMER_REAL, &timer, NULL);
+            execl("./solution", "solution", (char *)NULL);
+            _exit(127);
+        }
+        /* wait4 also reports the child's CPU time and peak RSS */
+        struct rusage usage;
+        wait4(pid, &status, 0, &usage);
+        long elapsed = (long)(now_ms() - start);
+        long cpu_ms = usage.ru_utime.tv_sec * 1000 + usage.ru_utime.tv_usec / 1000
+                    + usage.ru_stime.tv_sec * 1000 + usage.ru_stime.tv_usec / 1000;
+
+        size_t out_len;
+        char *out = slurp("run.out", &out_len);
+        err = slurp("run.err", &err_len);
+        if (WIFEXITED(status)) {
+            snprintf(header, sizeof(header), "run %d - %ld %zu %zu %ld %ld",
+                     WEXITSTATUS(status), elapsed, out_len, err_len, cpu_ms, usage.ru_maxrss);
+        } else {
+            snprintf(header, sizeof(header), "run - %s %ld %zu %zu %ld %ld",
+                     signal_name(WTERMSIG(status)), elapsed, out_len, err_len, cpu_ms, usage.ru_maxrss);
+        }
+        emit_record(header, out, out_len, err, err_len);
+        free(out);
+        free(err);
+    }
+    return 0;
+}
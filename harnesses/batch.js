@@ -0,0 +1,57 @@
+// Batch harness for JavaScript submissions.
+//
+// Reads the student program and every test input from stdin, then runs the
+// program once per input and writes one framed record per run to stdout.
+// See PistonAPI.execute_batch for the framing protocol.
+const fs = require('fs');
+const { spawnSync } = require('child_process');
+
+function readRecords(buffer) {
+    let pos = 0;
+    const readLine = () => {
+        const end = buffer.indexOf(10, pos);
+        const line = buffer.toString('ascii', pos, end);
+        pos = end + 1;
+        return line;
+    };
+    const count = parseInt(readLine(), 10);
+    const records = [];
+    for (let i = 0; i < count; i++) {
+        const length = parseInt(readLine(), 10);
+        records.push(buffer.subarray(pos, pos + length));
+        pos += length;
+    }
+    return records;
+}
+
+function emit(header, ...chunks) {
+    fs.writeSync(1, header + '\n');
+    for (const chunk of chunks) {
+        if (chunk.length) fs.writeSync(1, chunk);
+    }
+}
+
+const timeout = process.argv.length > 2 ? parseInt(process.argv[2], 10) : 3000;
+const records = readRecords(fs.readFileSync(0));
+const [source, ...inputs] = records;
+
+fs.writeFileSync('solution.js', source);
+
+// JavaScript has no separate compile stage
+emit('compile 0 0');
+
+for (const data of inputs) {
+    const start = process.hrtime.bigint();
+    const proc = spawnSync(process.execPath, ['solution.js'], {
+        input: data,
+        timeout: timeout,
+        killSignal: 'SIGKILL',
+        maxBuffer: 64 * 1024 * 1024,
+    });
+    const elapsedMs = Number((process.hrtime.bigint() - start) / 1000000n);
+    const stdout = proc.stdout || Buffer.alloc(0);
+    const stderr = proc.stderr || Buffer.alloc(0);
+    const code = proc.status === null ? '-' : proc.status;
+    const signal = proc.signal || '-';
+    emit(`run ${code} ${signal} ${elapsedMs} ${stdout.length} ${stderr.length}`, stdout, stderr);
+}
@@ -0,0 +1,81 @@
+"""
+Batch harness for Python submissions.
+
+Reads the student program and every test input from stdin, then runs the
+program once per input and writes one framed record per run to stdout.
+See PistonAPI.execute_batch for the framing protocol.
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+def read_records(stream):
+    count = int(stream.readline())
+    return [stream.read(int(stream.readline())) for _ in range(count)]
+
+
+def emit(out, header, *chunks):
+    out.write(header.encode() + b'\n')
+    for chunk in chunks:
+        out.write(chunk)
+    out.flush()
+
+
+def run_once(data, timeout):
+    """Run the solution on one input; returns (status, rusage, timed_out)"""
+    with open('input.txt', 'wb') as f:
+        f.write(data)
+    with open('input.txt', 'rb') as stdin, open('run.out', 'wb') as stdout, open('run.err', 'wb') as stderr:
+        proc = subprocess.Popen([sys.executable, 'solution.py'], stdin=stdin, stdout=stdout, stderr=stderr)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    # wait4 rather than Popen.wait: it also returns the child's CPU time and peak RSS
+    _, status, usage = os.wait4(proc.pid, 0)
+    timer.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage, timed_out.is_set()
+
+
+def main():
+    timeout = int(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 3
+    records = read_records(sys.stdin.buffer)
+    source, inputs = records[0], records[1:]
+
+    with open('solution.py', 'wb') as f:
+        f.write(source)
+
+    out = sys.stdout.buffer
+    # Python has no separate compile stage
+    emit(out, 'compile 0 0')
+
+    for data in inputs:
+        start = time.monotonic()
+        returncode, usage, timed_out = run_once(data, timeout)
+        elapsed_ms = int((time.monotonic() - start) * 1000)
+        with open('run.out', 'rb') as f:
+            stdout = f.read()
+        with open('run.err', 'rb') as f:
+            stderr = f.read()
+        if timed_out:
+            code, sig = '-', 'SIGKILL'
+        elif returncode < 0:
+            code, sig = '-', signal.Signals(-returncode).name
+        else:
+            code, sig = returncode, '-'
+        cpu_ms = int((usage.ru_utime + usage.ru_stime) * 1000)
+        emit(out, f'run {code} {sig} {elapsed_ms} {len(stdout)} {len(stderr)} {cpu_ms} {usage.ru_maxrss}',
+             stdout, stderr)
+
+
+if __name__ == '__main__':
+    main()
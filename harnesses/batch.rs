@@ -0,0 +1,110 @@
+// Batch harness for Rust submissions.
+//
+// Reads the student program and every test input from stdin, compiles the
+// program once and runs the binary once per input, writing one framed
+// record per run to stdout. See PistonAPI.execute_batch for the framing
+// protocol.
+use std::env;
+use std::fs::{self, File};
+use std::io::{self, BufRead, Read, Write};
+use std::os::unix::process::ExitStatusExt;
+use std::process::{Command, ExitStatus, Stdio};
+use std::thread;
+use std::time::{Duration, Instant};
+
+fn read_record(input: &mut impl BufRead) -> Vec<u8> {
+    let mut line = String::new();
+    input.read_line(&mut line).expect("record header");
+    let length: usize = line.trim().parse().expect("record length");
+    let mut data = vec![0u8; length];
+    input.read_exact(&mut data).expect("record body");
+    data
+}
+
+fn emit(out: &mut impl Write, header: &str, chunks: &[&[u8]]) {
+    out.write_all(header.as_bytes()).unwrap();
+    out.write_all(b"\n").unwrap();
+    for chunk in chunks {
+        out.write_all(chunk).unwrap();
+    }
+    out.flush().unwrap();
+}
+
+fn signal_name(signal: i32) -> &'static str {
+    match signal {
+        6 => "SIGABRT",
+        7 => "SIGBUS",
+        8 => "SIGFPE",
+        9 => "SIGKILL",
+        11 => "SIGSEGV",
+        24 => "SIGXCPU",
+        _ => "SIGTERM",
+    }
+}
+
+fn status_fields(status: ExitStatus) -> (String, String) {
+    match status.code() {
+        Some(code) => (code.to_string(), "-".to_string()),
+        None => ("-".to_string(), signal_name(status.signal().unwrap_or(15)).to_string()),
+    }
+}
+
+fn main() {
+    let timeout_ms: u64 = env::args().nth(1).and_then(|a| a.parse().ok()).unwrap_or(3000);
+    let stdin = io::stdin();
+    let mut input = stdin.lock();
+    let stdout = io::stdout();
+    let mut out = stdout.lock();
+
+    let mut line = String::new();
+    input.read_line(&mut line).expect("record count");
+    let count: usize = line.trim().parse().expect("record count");
+
+    fs::write("solution.rs", read_record(&mut input)).unwrap();
+
+    // Compile once
+    let compile = Command::new("rustc")
+        .args(["-O", "-o", "solution", "solution.rs"])
+        .stdin(Stdio::null())
+        .output()
+        .expect("rustc");
+    let compile_code = compile.status.code().unwrap_or(1);
+    emit(&mut out, &format!("compile {} {}", compile_code, compile.stderr.len()), &[&compile.stderr]);
+    if compile_code != 0 {
+        return;
+    }
+
+    // Run the binary once per input
+    for _ in 1..count {
+        fs::write("input.txt", read_record(&mut input)).unwrap();
+
+        let start = Instant::now();
+        let mut child = Command::new("./solution")
+            .stdin(File::open("input.txt").unwrap())
+            .stdout(File::create("run.out").unwrap())
+            .stderr(File::create("run.err").unwrap())
+            .spawn()
+            .expect("spawn solution");
+        let deadline = Duration::from_millis(timeout_ms);
+        let status = loop {
+            if let Some(status) = child.try_wait().unwrap() {
+                break status;
+            }
+            if start.elapsed() >= deadline {
+                let _ = child.kill();
+                break child.wait().unwrap();
+            }
+            thread::sleep(Duration::from_millis(1));
+        };
+        let elapsed = start.elapsed().as_millis();
+
+        let run_out = fs::read("run.out").unwrap_or_default();
+        let run_err = fs::read("run.err").unwrap_or_default();
+        let (code, signal) = status_fields(status);
+        emit(
+            &mut out,
+            &format!("run {} {} {} {} {}", code, signal, elapsed, run_out.len(), run_err.len()),
+            &[&run_out, &run_err],
+        );
+    }
+}
@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, func
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+import hashlib
 
 db = SQLAlchemy()
 
@@ -43,6 +44,12 @@ class Quiz(db.Model):
         return f'<Quiz {self.title}>'
 
 class Question(db.Model):
+    # Grading policies for code questions: which test cases still run once the outcome is known
+    RUN_ALL_TESTS = 'run_all'
+    STOP_ON_COMPILE_ERROR = 'stop_on_compile_error'
+    STOP_ON_FIRST_FAILURE = 'stop_on_first_failure'  # for all-or-nothing scoring
+    GRADING_POLICIES = (RUN_ALL_TESTS, STOP_ON_COMPILE_ERROR, STOP_ON_FIRST_FAILURE)
+    
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
     title = db.Column(db.String(200), nullable=False)
@@ -55,6 +62,7 @@ class Question(db.Model):
     # Fields for code questions
     starter_code = db.Column(db.Text)  # Initial code provided to students
     language = db.Column(db.String(20))  # python, c, java, etc.
+    grading_policy = db.Column(db.String(30), default=STOP_ON_COMPILE_ERROR)
     
     # Fields for multiple-choice questions
     options = db.relationship('QuestionOption', backref='question', lazy='dynamic', cascade='all, delete-orphan')
@@ -84,6 +92,44 @@ class TestCase(db.Model):
     expected_output = db.Column(db.Text, nullable=False)
     is_hidden = db.Column(db.Boolean, default=False)
     order = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, default=1)  # bumped whenever anything that affects grading changes
+    input_version = db.Column(db.Integer, default=1)  # bumped only when input_data changes
+    
+    # Optional resource budgets; a correct answer that exceeds one fails
+    time_limit = db.Column(db.Float)  # CPU seconds
+    memory_limit = db.Column(db.Integer)  # peak memory in MB
+    
+    # How output is checked against expected_output (see comparators.py)
+    comparator = db.Column(db.String(20), default='exact')
+    abs_tolerance = db.Column(db.Float)  # 'float' comparator only
+    rel_tolerance = db.Column(db.Float)
+    
+    def set_content(self, input_data, expected_output):
+        """Update input and expected output, invalidating earlier results if either changed"""
+        if (self.input_data or '') != (input_data or ''):
+            # Output produced from the old input no longer says anything
+            self.input_version = (self.input_version or 1) + 1
+            self.version = (self.version or 1) + 1
+        elif self.expected_output != expected_output:
+            self.version = (self.version or 1) + 1
+        self.input_data = input_data
+        self.expected_output = expected_output
+    
+    def set_budgets(self, time_limit, memory_limit):
+        """Update the resource budgets, invalidating earlier results if either changed"""
+        if self.time_limit != time_limit or self.memory_limit != memory_limit:
+            self.version = (self.version or 1) + 1
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+    
+    def set_comparison(self, comparator, abs_tolerance=None, rel_tolerance=None):
+        """Update how output is compared, invalidating earlier results if it changed"""
+        if ((self.comparator or 'exact') != comparator or self.abs_tolerance != abs_tolerance
+                or self.rel_tolerance != rel_tolerance):
+            self.version = (self.version or 1) + 1
+        self.comparator = comparator
+        self.abs_tolerance = abs_tolerance
+        self.rel_tolerance = rel_tolerance
     
     def __repr__(self):
         return f'<TestCase {self.id} for Question {self.question_id}>'
@@ -93,24 +139,95 @@ class Submission(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime, index=True)
     is_completed = db.Column(db.Boolean, default=False)
     score = db.Column(db.Float)
     total_points = db.Column(db.Integer)
     
     question_submissions = db.relationship('QuestionSubmission', backref='submission', lazy='dynamic', cascade='all, delete-orphan')
     
+    @property
+    def deadline(self):
+        """When the quiz time limit runs out for this attempt"""
+        return self.started_at + timedelta(minutes=self.quiz.time_limit)
+    
     def calculate_score(self):
-        total_points = sum([q.points for q in self.quiz.questions])
-        earned_points = sum([qs.score for qs in self.question_submissions])
+        # Each answer keeps its own score up to date, so the totals are a
+        # single aggregate query however many questions the quiz has
+        total_points = db.session.query(func.coalesce(func.sum(Question.points), 0)).filter(
+            Question.quiz_id == self.quiz_id
+        ).scalar_subquery()
+        earned_points = db.session.query(func.coalesce(func.sum(QuestionSubmission.score), 0)).filter(
+            QuestionSubmission.submission_id == self.id
+        ).scalar_subquery()
+        earned_points, total_points = db.session.query(earned_points, total_points).one()
         
-        self.score = earned_points
+        self.score = float(earned_points)
         self.total_points = total_points
         return self.score, self.total_points
     
     def __repr__(self):
         return f'<Submission {self.id} by User {self.user_id} for Quiz {self.quiz_id}>'
 
+class SubmissionProgress:
+    """
+    Which questions of a submission have been answered
+    
+    Loaded with one query (question id -> answer id) and updated by the
+    caller as answers are saved, so navigation, progress and the "all
+    answered" check run in memory instead of querying once per question.
+    """
+    
+    def __init__(self, questions, answered):
+        self.questions = questions  # in quiz order
+        # Ids are read once: the question objects expire when answers are committed
+        self.question_ids = [q.id for q in questions]
+        self.answered = answered
+    
+    @classmethod
+    def load(cls, submission, questions):
+        rows = db.session.query(QuestionSubmission.question_id, QuestionSubmission.id).filter(
+            QuestionSubmission.submission_id == submission.id
+        ).all()
+        return cls(questions, dict(rows))
+    
+    def is_answered(self, question):
+        return question.id in self.answered
+    
+    def answer_id(self, question):
+        """Id of the QuestionSubmission for question, or None"""
+        return self.answered.get(question.id)
+    
+    def mark_answered(self, question_submission):
+        self.answered[question_submission.question_id] = question_submission.id
+    
+    @property
+    def unanswered(self):
+        return [q for q, q_id in zip(self.questions, self.question_ids) if q_id not in self.answered]
+    
+    @property
+    def answered_count(self):
+        return sum(1 for q_id in self.question_ids if q_id in self.answered)
+    
+    @property
+    def all_answered(self):
+        return all(q_id in self.answered for q_id in self.question_ids)
+    
+    def first_unanswered(self):
+        return self._unanswered_from(0)
+    
+    def next_unanswered(self, question):
+        """First unanswered question after the given one, or None"""
+        question_id = question.id
+        start = self.question_ids.index(question_id) + 1 if question_id in self.question_ids else 0
+        return self._unanswered_from(start)
+    
+    def _unanswered_from(self, start):
+        for index in range(start, len(self.question_ids)):
+            if self.question_ids[index] not in self.answered:
+                return self.questions[index]
+        return None
+
 class QuestionSubmission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'))
@@ -119,6 +236,7 @@ class QuestionSubmission(db.Model):
     # For code questions
     code = db.Column(db.Text)
     language = db.Column(db.String(20))
+    source_hash = db.Column(db.String(64))  # fingerprint of the last graded language + code
     
     # For multiple choice and true/false questions
     selected_options = db.relationship('SelectedOption', backref='question_submission', lazy='dynamic', cascade='all, delete-orphan')
@@ -127,18 +245,36 @@ class QuestionSubmission(db.Model):
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     test_results = db.relationship('TestResult', backref='question_submission', lazy='dynamic', cascade='all, delete-orphan')
+    grading_jobs = db.relationship('GradingJob', backref='question_submission', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @staticmethod
+    def fingerprint(language, code):
+        """Fingerprint identifying a code answer for incremental re-grading"""
+        return hashlib.sha256(f'{language}\0{code or ""}'.encode('utf-8')).hexdigest()
+    
+    @property
+    def grading_job(self):
+        """Most recent grading job for this answer, if any"""
+        return self.grading_jobs.order_by(GradingJob.id.desc()).first()
+    
+    @property
+    def is_grading(self):
+        job = self.grading_job
+        return job is not None and job.is_pending
     
     def calculate_score(self):
         # Calculate score based on question type
         question = self.question
         if question.question_type == 'code':
             # For code questions, score is based on passed test cases
-            total_tests = self.test_results.count()
+            total_tests, passed_tests = db.session.query(
+                func.count(TestResult.id),
+                func.coalesce(func.sum(case((TestResult.passed == True, 1), else_=0)), 0)
+            ).filter(TestResult.question_submission_id == self.id).one()
             if total_tests == 0:
                 self.score = 0
                 return self.score
                 
-            passed_tests = self.test_results.filter_by(passed=True).count()
             self.score = (passed_tests / total_tests) * question.points
             
         elif question.question_type == 'multiple_choice':
@@ -178,15 +314,142 @@ class SelectedOption(db.Model):
         return f'<SelectedOption {self.id} for Submission {self.question_submission_id}>'
 
 class TestResult(db.Model):
+    COMPLETED = 'completed'
+    SKIPPED = 'skipped'  # not run, the question's grading policy stopped early
+    DEADLINE_EXCEEDED = 'deadline_exceeded'  # not run before the quiz time limit (plus grace) passed
+    PENDING = 'pending'  # not run yet, the execution backend was unavailable; the job is retried
+    
+    # One result per test case of an answer; grading updates it in place
+    __table_args__ = (
+        db.UniqueConstraint('question_submission_id', 'test_case_id', name='uq_test_result_test_case'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     question_submission_id = db.Column(db.Integer, db.ForeignKey('question_submission.id'))
     test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'))
     passed = db.Column(db.Boolean, default=False)
     output = db.Column(db.Text)
     error = db.Column(db.Text)
-    execution_time = db.Column(db.Float)  # in seconds
+    execution_time = db.Column(db.Float)  # wall time of the program in seconds, None if the backend does not report it
+    cpu_time = db.Column(db.Float)  # in seconds, None if the backend does not report it
+    peak_memory = db.Column(db.Integer)  # in KB, None if the backend does not report it
+    status = db.Column(db.String(20), default=COMPLETED)
+    
+    # What this result was produced from; a result is reused on re-grading
+    # while both still match. source_hash is None if execution itself failed.
+    source_hash = db.Column(db.String(64))
+    test_case_version = db.Column(db.Integer)
+    input_version = db.Column(db.Integer)  # TestCase.input_version the program was run with
+    # The verdict came from comparing the complete stored output (clean exit,
+    # nothing on stderr), so it can be re-judged without running the code again
+    output_judged = db.Column(db.Boolean, default=False)
+    compile_error = db.Column(db.Boolean, default=False)  # the program did not compile
     
     test_case = db.relationship('TestCase')
     
+    @property
+    def is_skipped(self):
+        return self.status == self.SKIPPED
+    
+    @property
+    def is_deadline_exceeded(self):
+        return self.status == self.DEADLINE_EXCEEDED
+    
+    @property
+    def is_pending(self):
+        return self.status == self.PENDING
+    
+    def is_current(self, source_hash, test_case):
+        """Whether this result is still valid for the given code fingerprint and test case"""
+        return (
+            self.source_hash is not None
+            and self.source_hash == source_hash
+            and self.test_case_version == test_case.version
+        )
+    
+    def can_rejudge(self, source_hash, test_case):
+        """Whether this result can be brought up to date from its stored output alone"""
+        return (
+            self.output_judged
+            and self.status == self.COMPLETED
+            and self.source_hash is not None
+            and self.source_hash == source_hash
+            and self.input_version == test_case.input_version
+        )
+    
+    def __repr__(self):
+        return f'<TestResult {self.id} for Test Case {self.test_case_id}>'
+
+class GradingJob(db.Model):
+    """A queued request to grade a code answer, drained by the grading workers"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+    EXPIRED = 'expired'  # the submission deadline passed before grading finished
+    PENDING_STATUSES = (QUEUED, RUNNING)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    question_submission_id = db.Column(db.Integer, db.ForeignKey('question_submission.id'), index=True)
+    status = db.Column(db.String(20), default=QUEUED, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)  # not picked up before this (retry backoff)
+    started_at = db.Column(db.DateTime)
+    locked_until = db.Column(db.DateTime)  # lease; an expired lease means the worker died
+    finished_at = db.Column(db.DateTime)
+    deadline = db.Column(db.DateTime)  # test cases not started by then are not run
+    
+    @property
+    def is_pending(self):
+        return self.status in self.PENDING_STATUSES
+    
+    @classmethod
+    def latest_for(cls, question_submission_ids):
+        """Most recent job of each of the answers, in one query: {question submission id: GradingJob}"""
+        if not question_submission_ids:
+            return {}
+        latest = db.session.query(func.max(cls.id)).filter(
+            cls.question_submission_id.in_(question_submission_ids)
+        ).group_by(cls.question_submission_id)
+        return {job.question_submission_id: job for job in cls.query.filter(cls.id.in_(latest))}
+    
+    def __repr__(self):
+        return f'<GradingJob {self.id} for QuestionSubmission {self.question_submission_id} ({self.status})>'
+
+class RescoreRun(db.Model):
+    """A pass bringing every stored score of a quiz up to date, with its progress"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    PENDING_STATUSES = (QUEUED, RUNNING)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), index=True)
+    status = db.Column(db.String(20), default=QUEUED)
+    total = db.Column(db.Integer, default=0)  # answers to rescore
+    processed = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer, default=0)  # answers whose score changed
+    regraded = db.Column(db.Integer, default=0)  # code answers queued to run again
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # progress heartbeat
+    finished_at = db.Column(db.DateTime)
+    
+    quiz = db.relationship('Quiz')
+    
+    @property
+    def is_pending(self):
+        return self.status in self.PENDING_STATUSES
+    
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        return int(100 * self.processed / self.total) if self.total else 0
+    
     def __repr__(self):
-        return f'<TestResult {self.id} for Test Case {self.test_case_id}>'
\ No newline at end of file
+        return f'<RescoreRun {self.id} for Quiz {self.quiz_id} ({self.status})>'
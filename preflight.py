@@ -0,0 +1,125 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import logging
+from functools import lru_cache
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Compiles the program read from stdin without running it and prints the
+# syntax error the way the interpreter itself would
+PYTHON_CHECK = r'''
+import sys, traceback
+source = sys.stdin.buffer.read()
+try:
+    compile(source, sys.argv[1], 'exec', dont_inherit=True)
+except (SyntaxError, ValueError) as e:
+    sys.stderr.write(''.join(traceback.format_exception_only(type(e), e)))
+    sys.exit(1)
+'''
+
+
+def _version_tuple(version):
+    """Leading numeric part of a runtime version ('node-18.12.1' -> (18, 12, 1))"""
+    match = re.search(r'\d+(\.\d+)*', version or '')
+    return tuple(int(part) for part in match.group(0).split('.')) if match else ()
+
+
+def check_python(code, filename, version):
+    """Byte-compile with the local interpreter in a subprocess"""
+    # An older interpreter than the backend's would reject newer syntax
+    if sys.version_info[:len(_version_tuple(version))] < _version_tuple(version):
+        return None
+    proc = subprocess.run(
+        [sys.executable, '-I', '-c', PYTHON_CHECK, filename],
+        input=code.encode('utf-8'),
+        capture_output=True,
+        timeout=Config.EXECUTION_PREFLIGHT_TIMEOUT
+    )
+    if proc.returncode == 0:
+        return None
+    return proc.stderr.decode('utf-8', errors='replace')
+
+
+@lru_cache(maxsize=1)
+def _node_version():
+    node = shutil.which('node')
+    if node is None:
+        return None, ()
+    proc = subprocess.run([node, '--version'], capture_output=True, timeout=Config.EXECUTION_PREFLIGHT_TIMEOUT)
+    return node, _version_tuple(proc.stdout.decode('ascii', errors='replace'))
+
+
+def check_javascript(code, filename, version):
+    """Parse with 'node --check' if a recent enough node is installed here"""
+    node, local_version = _node_version()
+    target = _version_tuple(version)
+    if node is None or local_version[:len(target)] < target:
+        return None
+    workdir = tempfile.mkdtemp(prefix='quiz-preflight-', dir=Config.LOCAL_SANDBOX_TMPDIR)
+    try:
+        path = os.path.join(workdir, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        proc = subprocess.run(
+            [node, '--check', filename],
+            cwd=workdir,
+            capture_output=True,
+            timeout=Config.EXECUTION_PREFLIGHT_TIMEOUT
+        )
+        if proc.returncode == 0:
+            return None
+        error = proc.stderr.decode('utf-8', errors='replace').replace(workdir + os.sep, '')
+        # The stack trace is node's own, not the program's
+        return error.split('\n    at ')[0].rstrip() + '\n'
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Checkers by name, referenced from the 'preflight' entry of a language in
+# Config.SUPPORTED_LANGUAGES. A checker takes (code, filename, version) and
+# returns the compiler error text, or None if the code parses (or it cannot
+# tell); it must never reject code the backend would accept.
+CHECKERS = {
+    'python': check_python,
+    'javascript': check_javascript,
+}
+
+
+def register_checker(name, checker):
+    """Make a checker available to the 'preflight' language setting"""
+    CHECKERS[name] = checker
+    check_syntax.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def check_syntax(language, code, filename, version):
+    """
+    Look for syntax errors locally before code is sent for execution
+
+    Args:
+        language (str): Programming language
+        code (str): Source code
+        filename (str): Name the backend gives the source file
+        version (str): Runtime version the code will run on
+
+    Returns:
+        str: The error output, or None if the code passed or was not checked
+    """
+    if not Config.EXECUTION_PREFLIGHT_ENABLED:
+        return None
+    checker = CHECKERS.get(Config.SUPPORTED_LANGUAGES.get(language, {}).get('preflight'))
+    if checker is None or not code:
+        return None
+
+    try:
+        return checker(code, filename, version)
+    except (OSError, subprocess.SubprocessError) as e:
+        # The backend will report any error itself
+        logger.warning(f"Pre-flight check for {language} failed: {str(e)}")
+        return None
@@ -0,0 +1,259 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models import (GradingJob, Question, QuestionOption, QuestionSubmission, Quiz, SelectedOption, Submission,
+                    TestCase, TestResult, User)
+
+
+class SubmissionResults:
+    """
+    Everything needed to show a graded submission, loaded up front
+    
+    A fixed number of queries (submission with student and quiz, questions,
+    options, answers, selected options, test results with their test cases,
+    grading jobs) regardless of how many questions the quiz has. Lookups are
+    by question id.
+    """
+    
+    def __init__(self, submission, questions, options, answers, selected, test_results, pending=()):
+        self.submission = submission
+        self.quiz = submission.quiz
+        self.questions = questions  # in quiz order
+        self.options = options  # question id -> [QuestionOption] in display order
+        self.answers = answers  # question id -> QuestionSubmission
+        self.selected = selected  # question id -> [SelectedOption]
+        self.test_results = test_results  # question id -> [TestResult] in test-case order
+        self.pending = set(pending)  # ids of questions whose answer is still being graded
+    
+    @classmethod
+    def load(cls, submission_id, visible_only=True):
+        """
+        Load a submission and its results
+        
+        Args:
+            submission_id (int): Submission to load
+            visible_only (bool): Leave out results of hidden test cases
+        
+        Returns:
+            SubmissionResults: The assembled results, or None if there is no such submission
+        """
+        submission = Submission.query.options(
+            joinedload(Submission.student),
+            joinedload(Submission.quiz)
+        ).filter(Submission.id == submission_id).first()
+        if submission is None:
+            return None
+        
+        questions = Question.query.filter_by(quiz_id=submission.quiz_id).order_by(Question.order).all()
+        question_ids = [q.id for q in questions]
+        
+        options = defaultdict(list)
+        for option in QuestionOption.query.filter(
+            QuestionOption.question_id.in_(question_ids)
+        ).order_by(QuestionOption.order, QuestionOption.id):
+            options[option.question_id].append(option)
+        
+        answers = {
+            qs.question_id: qs for qs in QuestionSubmission.query.filter_by(submission_id=submission.id)
+        }
+        question_by_answer = {qs.id: qs.question_id for qs in answers.values()}
+        
+        # Options are already in the session, so selected_option.option needs no query
+        selected = defaultdict(list)
+        for selected_option in SelectedOption.query.filter(
+            SelectedOption.question_submission_id.in_(question_by_answer)
+        ).order_by(SelectedOption.id):
+            selected[question_by_answer[selected_option.question_submission_id]].append(selected_option)
+        
+        results_query = TestResult.query.join(TestResult.test_case).options(
+            contains_eager(TestResult.test_case)
+        ).filter(TestResult.question_submission_id.in_(question_by_answer))
+        if visible_only:
+            results_query = results_query.filter(TestCase.is_hidden == False)
+        test_results = defaultdict(list)
+        for result in results_query.order_by(TestCase.order, TestCase.id):
+            test_results[question_by_answer[result.question_submission_id]].append(result)
+        
+        # Their score does not count yet (e.g. hidden test cases still running)
+        pending = {
+            question_by_answer[answer_id] for answer_id, job in
+            GradingJob.latest_for(list(question_by_answer)).items() if job.is_pending
+        }
+        
+        return cls(submission, questions, options, answers, selected, test_results, pending)
+    
+    @property
+    def answered(self):
+        """The question submissions, in quiz order"""
+        return [self.answers[q.id] for q in self.questions if q.id in self.answers]
+    
+    @property
+    def is_provisional(self):
+        """Whether the score may still change because some answers are being graded"""
+        return bool(self.pending)
+    
+    def selected_option_ids(self, question_id):
+        return [so.option_id for so in self.selected.get(question_id, [])]
+
+
+class SubmissionFilters:
+    """Which submissions of an author's quizzes to list, as given in a query string"""
+    
+    COMPLETED = 'completed'
+    IN_PROGRESS = 'in_progress'
+    ALL = 'all'
+    STATUSES = (COMPLETED, IN_PROGRESS, ALL)
+    
+    DATE_FORMAT = '%Y-%m-%d'
+    
+    def __init__(self, quiz_id=None, student=None, date_from=None, date_to=None, status=COMPLETED):
+        self.quiz_id = quiz_id
+        self.student = student  # part of the username
+        self.date_from = date_from  # first day included
+        self.date_to = date_to  # last day included
+        self.status = status
+    
+    @classmethod
+    def from_args(cls, args):
+        """Build filters from request arguments, ignoring values that do not parse"""
+        status = args.get('status')
+        return cls(
+            quiz_id=args.get('quiz_id', type=int),
+            student=(args.get('student') or '').strip() or None,
+            date_from=cls._parse_date(args.get('date_from')),
+            date_to=cls._parse_date(args.get('date_to')),
+            status=status if status in cls.STATUSES else cls.COMPLETED
+        )
+    
+    @classmethod
+    def _parse_date(cls, value):
+        try:
+            return datetime.strptime(value, cls.DATE_FORMAT) if value else None
+        except ValueError:
+            return None
+    
+    def to_args(self):
+        """The filters as request arguments, for links to other pages of the same listing"""
+        args = {
+            'quiz_id': self.quiz_id,
+            'student': self.student,
+            'date_from': self.date_from.strftime(self.DATE_FORMAT) if self.date_from else None,
+            'date_to': self.date_to.strftime(self.DATE_FORMAT) if self.date_to else None,
+            'status': self.status if self.status != self.COMPLETED else None
+        }
+        return {name: value for name, value in args.items() if value is not None}
+    
+    @property
+    def sort_column(self):
+        """When a submission happened for ordering and date ranges: completion, else the start"""
+        if self.status == self.COMPLETED:
+            return Submission.completed_at
+        if self.status == self.IN_PROGRESS:
+            return Submission.started_at
+        return func.coalesce(Submission.completed_at, Submission.started_at)
+    
+    def sort_value(self, submission):
+        """sort_column of a loaded submission"""
+        if self.status == self.COMPLETED:
+            return submission.completed_at
+        if self.status == self.IN_PROGRESS:
+            return submission.started_at
+        return submission.completed_at or submission.started_at
+    
+    def apply(self, query):
+        if self.status == self.COMPLETED:
+            query = query.filter(Submission.is_completed == True)
+        elif self.status == self.IN_PROGRESS:
+            query = query.filter(Submission.is_completed == False)
+        if self.quiz_id:
+            query = query.filter(Submission.quiz_id == self.quiz_id)
+        if self.student:
+            query = query.filter(User.username.icontains(self.student, autoescape=True))
+        if self.date_from:
+            query = query.filter(self.sort_column >= self.date_from)
+        if self.date_to:
+            query = query.filter(self.sort_column < self.date_to + timedelta(days=1))
+        return query
+
+
+def _submissions_query(author_id, filters):
+    """Filtered submissions of the author's quizzes, joined with their quiz and student"""
+    query = Submission.query.join(Submission.quiz).join(Submission.student).filter(Quiz.author_id == author_id)
+    return filters.apply(query)
+
+
+def list_submissions(author_id, filters=None, after=None, limit=50):
+    """
+    One page of submissions, newest first
+    
+    Pages are keyset-based: each page continues after the (time, id) of the
+    last submission of the previous one, so deep pages cost the same as the
+    first and nothing is skipped or repeated while new submissions arrive.
+    
+    Args:
+        author_id (int): Only submissions of this user's quizzes
+        filters (SubmissionFilters): What to list (default completed submissions)
+        after (str): Cursor returned for the previous page, None for the first
+        limit (int): Page size
+    
+    Returns:
+        tuple: (list of Submission, cursor of the next page or None if this is the last)
+    """
+    filters = filters or SubmissionFilters()
+    sort_column = filters.sort_column
+    # The student and quiz shown on every row come with the same query
+    query = _submissions_query(author_id, filters).options(
+        contains_eager(Submission.quiz),
+        contains_eager(Submission.student)
+    )
+    
+    position = _decode_cursor(after)
+    if position is not None:
+        sort_value, submission_id = position
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, Submission.id < submission_id)
+        ))
+    
+    # One extra row tells whether there is a next page
+    submissions = query.order_by(sort_column.desc(), Submission.id.desc()).limit(limit + 1).all()
+    if len(submissions) <= limit:
+        return submissions, None
+    submissions = submissions[:limit]
+    last = submissions[-1]
+    return submissions, _encode_cursor(filters.sort_value(last), last.id)
+
+
+def count_submissions(author_id, filters=None):
+    """Number of submissions list_submissions would page through"""
+    query = _submissions_query(author_id, filters or SubmissionFilters())
+    return query.with_entities(func.count(Submission.id)).scalar()
+
+
+def question_counts(quiz_ids):
+    """Number of questions of each quiz, in one query; quizzes without questions are left out"""
+    if not quiz_ids:
+        return {}
+    return dict(
+        Question.query.with_entities(Question.quiz_id, func.count(Question.id))
+        .filter(Question.quiz_id.in_(quiz_ids))
+        .group_by(Question.quiz_id)
+    )
+
+
+def _encode_cursor(sort_value, submission_id):
+    return f"{sort_value.isoformat()}_{submission_id}"
+
+
+def _decode_cursor(cursor):
+    """(time, id) from a cursor, or None if there is none or it is malformed"""
+    if not cursor:
+        return None
+    sort_value, _, submission_id = cursor.rpartition('_')
+    try:
+        return datetime.fromisoformat(sort_value), int(submission_id)
+    except ValueError:
+        return None
@@ -1,5 +1,6 @@
 from app import create_app
 from models import db, User
+from schema import upgrade_schema
 from datetime import datetime
 
 app = create_app()
@@ -20,6 +21,12 @@ def init_db():
             db.session.commit()
             print('Admin user created: admin/admin')
 
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    """Add tables, columns and indexes missing from an existing database."""
+    added = upgrade_schema()
+    print(f"Added columns: {', '.join(added)}" if added else 'Database schema is up to date')
+
 if __name__ == '__main__':
     with app.app_context():
         # Create tables if they don't exist
@@ -0,0 +1,296 @@
+import os
+import pwd
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# How each language is compiled and run on this host. '{file}' is replaced by
+# the name of the main source file. 'memory_factor' scales the address-space
+# limit for runtimes that reserve a lot of virtual memory up front.
+LANGUAGE_COMMANDS = {
+    'python': {
+        'run': [sys.executable, '{file}'],
+    },
+    'c': {
+        'compile': ['gcc', '-O2', '-o', 'main', '{file}', '-lm'],
+        'run': ['./main'],
+    },
+    'java': {
+        # Single-file source launcher (Java 11+), as Piston does
+        'run': ['java', '{file}'],
+        'memory_factor': 8,
+    },
+    'javascript': {
+        'run': ['node', '{file}'],
+        'memory_factor': 8,
+    },
+    'rust': {
+        'compile': ['rustc', '-O', '-o', 'main', '{file}'],
+        'run': ['./main'],
+        'memory_factor': 4,
+    },
+}
+
+# Environment variables passed through to sandboxed processes
+TOOLCHAIN_ENV = ('RUSTUP_HOME', 'CARGO_HOME', 'RUSTUP_TOOLCHAIN', 'JAVA_HOME')
+
+
+# Forks and execs each program and reports its resource usage (see the module)
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_launcher.py')
+
+
+class LocalExecutor:
+    """
+    Execution backend that runs code in sandboxed subprocesses on this host.
+    
+    Each execution gets a fresh temporary working directory and a minimal
+    environment, runs as Config.LOCAL_SANDBOX_USER under rlimits for CPU
+    time, address space, file size and process count, with a wall-clock
+    timeout that kills the whole process group. Results use the same shape
+    as Piston responses.
+    
+    Without a sandbox user, programs run as the web server's user and can
+    read whatever it can (the database, other processes' environment), so
+    the backend then refuses to start unless FLASK_DEBUG is set.
+    """
+    
+    # Runs are only bounded by the timeouts in the payload
+    max_run_timeout = None
+    
+    def __init__(self):
+        # (uid, gid) programs run as, None for this process' own user
+        self.user = self._sandbox_user()
+    
+    @staticmethod
+    def _sandbox_user():
+        name = Config.LOCAL_SANDBOX_USER
+        if not name:
+            if not Config.DEBUG:
+                raise ValueError('The local code execution backend needs LOCAL_SANDBOX_USER outside development '
+                                 '(FLASK_DEBUG)')
+            logger.warning('LOCAL_SANDBOX_USER is not set: submitted code runs as the web server user')
+            return None
+        try:
+            account = pwd.getpwnam(name)
+        except KeyError:
+            raise ValueError(f'Unknown LOCAL_SANDBOX_USER: {name}')
+        if account.pw_uid == 0:
+            raise ValueError('LOCAL_SANDBOX_USER must be an unprivileged user')
+        if os.geteuid() not in (0, account.pw_uid):
+            raise ValueError(f'Running code as {name} requires the server to run as root')
+        return account.pw_uid, account.pw_gid
+    
+    def execute(self, language, payload):
+        """
+        Run an execution payload locally
+        
+        Args:
+            language (str): Programming language
+            payload (dict): Piston /execute request body
+        
+        Returns:
+            dict: Piston-style result containing execution results
+        """
+        commands = LANGUAGE_COMMANDS.get(language)
+        if commands is None:
+            return {
+                'success': False,
+                'error': f'Language {language} is not available on the local backend'
+            }
+        
+        files = payload.get('files') or []
+        if not files:
+            return {
+                'success': False,
+                'error': 'No source files provided'
+            }
+        
+        workdir = tempfile.mkdtemp(prefix='quiz-sandbox-', dir=Config.LOCAL_SANDBOX_TMPDIR)
+        try:
+            start_time = time.time()
+            
+            for f in files:
+                name = os.path.basename(f['name'])
+                with open(os.path.join(workdir, name), 'w', encoding='utf-8') as fh:
+                    fh.write(f['content'])
+            main_file = os.path.basename(files[0]['name'])
+            
+            # The program owns its working directory (compilers write their output there)
+            if self.user is not None:
+                for name in [workdir] + [os.path.join(workdir, entry) for entry in os.listdir(workdir)]:
+                    os.chown(name, *self.user)
+            
+            memory_limit = self._memory_limit(payload, commands)
+            result = {
+                'language': language,
+                'version': payload.get('version'),
+            }
+            
+            if 'compile' in commands:
+                compile_result = self._run(
+                    self._format(commands['compile'], main_file),
+                    workdir,
+                    '',
+                    payload.get('compile_timeout', Config.CODE_COMPILE_TIMEOUT * 1000) / 1000,
+                    memory_limit
+                )
+                result['compile'] = compile_result
+                if compile_result['code'] != 0:
+                    result['run'] = {'stdout': '', 'stderr': '', 'output': '', 'code': None, 'signal': None}
+                    result['success'] = True
+                    result['execution_time'] = time.time() - start_time
+                    return result
+            
+            result['run'] = self._run(
+                self._format(commands['run'], main_file) + list(payload.get('args') or []),
+                workdir,
+                payload.get('stdin') or '',
+                payload.get('run_timeout', Config.CODE_EXECUTION_TIMEOUT * 1000) / 1000,
+                memory_limit
+            )
+            result['success'] = True
+            result['execution_time'] = time.time() - start_time
+            
+            if result['run']['code'] not in (0, None):
+                logger.warning(f"Code execution returned non-zero exit code: {result['run']['code']}")
+            
+            return result
+        
+        except OSError as e:
+            logger.error(f"Local execution failed: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Execution error: {str(e)}'
+            }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    @staticmethod
+    def _format(command, main_file):
+        return [part.replace('{file}', main_file) for part in command]
+    
+    @staticmethod
+    def _memory_limit(payload, commands):
+        """Address-space limit in bytes (-1 in the payload means use the configured default)"""
+        limit = payload.get('run_memory_limit', -1)
+        if limit is None or limit < 0:
+            limit = Config.LOCAL_SANDBOX_MEMORY_LIMIT * 1024 * 1024
+        return limit * commands.get('memory_factor', 1)
+    
+    def _limits(self, cpu_seconds, memory_limit):
+        """Return the launcher's limits argument: "<cpu seconds>:<address space>:<file size>:<processes or ->" """
+        file_size = Config.LOCAL_SANDBOX_MAX_FILE_SIZE * 1024 * 1024
+        # The process limit counts every process of the user, so it only
+        # means something for a user of the sandbox's own
+        max_processes = Config.LOCAL_SANDBOX_MAX_PROCESSES if self.user is not None else '-'
+        return f'{cpu_seconds}:{memory_limit}:{file_size}:{max_processes}'
+    
+    def _run(self, command, workdir, stdin, timeout, memory_limit):
+        """Run one command in the sandbox and return a Piston-style stage result"""
+        # Nothing of the server's own environment (SECRET_KEY, DATABASE_URL, ...) is passed on
+        env = {
+            'PATH': os.environ.get('PATH', '/usr/bin:/bin'),
+            'HOME': workdir,
+            'LANG': 'C.UTF-8',
+        }
+        # Toolchain managers (rustup, sdkman, ...) locate compilers through these
+        for name in TOOLCHAIN_ENV:
+            if name in os.environ:
+                env[name] = os.environ[name]
+        if 'RUSTUP_HOME' not in env and os.path.isdir(os.path.expanduser('~/.rustup')):
+            env['RUSTUP_HOME'] = os.path.expanduser('~/.rustup')
+        
+        # The program reads its input from and writes its output to unlinked
+        # temporary files rather than pipes: the input is written once, and
+        # output is bounded by the file size rlimit instead of held in memory
+        with tempfile.TemporaryFile(dir=Config.LOCAL_SANDBOX_TMPDIR) as stdin_file, \
+                tempfile.TemporaryFile(dir=Config.LOCAL_SANDBOX_TMPDIR) as stdout_file, \
+                tempfile.TemporaryFile(dir=Config.LOCAL_SANDBOX_TMPDIR) as stderr_file:
+            stdin_file.write(stdin.encode('utf-8'))
+            stdin_file.seek(0)
+        
+            # The launcher runs the program and reports its wait status and usage
+            report_read, report_write = os.pipe()
+            start_time = time.monotonic()
+            try:
+                proc = subprocess.Popen(
+                    [sys.executable, '-I', '-S', LAUNCHER, str(report_write),
+                     f'{self.user[0]}:{self.user[1]}' if self.user is not None else '-',
+                     self._limits(int(timeout) + 1, memory_limit)] + command,
+                    cwd=workdir,
+                    env=env,
+                    stdin=stdin_file,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    pass_fds=(report_write,),
+                    # Own process group so a timeout kills everything the program spawned
+                    start_new_session=True
+                )
+            finally:
+                os.close(report_write)
+            
+            timed_out = threading.Event()
+            
+            def kill():
+                if proc.returncode is not None:
+                    return
+                timed_out.set()
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+            with os.fdopen(report_read) as report_file:
+                # Empty if the launcher was killed along with the program
+                report = report_file.read().split()
+            proc.wait()
+            timer.cancel()
+            wall_time = time.monotonic() - start_time
+            signal_name = 'SIGKILL' if timed_out.is_set() else None
+            
+            stdout_file.seek(0)
+            stdout = stdout_file.read()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+        
+        code = proc.returncode
+        usage = None
+        if report:
+            wait_status, user_time, system_time, peak_memory, memory_floor = report
+            code = os.waitstatus_to_exitcode(int(wait_status))
+            usage = {
+                'cpu_time': float(user_time) + float(system_time),
+                # Peaks at or below the launcher's own size cannot be measured
+                'memory': int(peak_memory) if int(peak_memory) > int(memory_floor) else None
+            }
+        if code is not None and code < 0:
+            signal_name = signal_name or signal.Signals(-code).name
+            code = None
+        elif signal_name:
+            code = None
+        
+        stdout = stdout.decode('utf-8', errors='replace')
+        stderr = stderr.decode('utf-8', errors='replace')
+        # Same units as Piston: milliseconds and bytes (the launcher reports KB);
+        # memory is None for programs smaller than the launcher (a few MB)
+        return {
+            'stdout': stdout,
+            'stderr': stderr,
+            'output': stdout + stderr,
+            'code': code,
+            'signal': signal_name,
+            'wall_time': int(wall_time * 1000),
+            'cpu_time': int(usage['cpu_time'] * 1000) if usage else None,
+            'memory': usage['memory'] * 1024 if usage and usage['memory'] is not None else None
+        }
@@ -0,0 +1,95 @@
+"""
+Runs one sandboxed program and reports its resource usage
+
+Usage: python -I -S sandbox_launcher.py <report fd> <uid:gid or -> <limits> <command> [args...]
+
+<limits> is "<cpu seconds>:<address space bytes>:<file size bytes>:<processes or ->".
+
+A child's peak RSS starts out at the size of the process it was forked
+from, so programs forked straight from the web server would all appear to
+use as much memory as the server. This launcher is a small process of its
+own: it forks, applies the rlimits and execs the program (as the given
+user, if any), reaps it with wait4 and writes
+"<wait status> <user seconds> <system seconds> <peak RSS KB> <own peak RSS KB>"
+to the report file descriptor. Only standard library modules that the
+interpreter has loaded anyway (and the small resource module) are used,
+to keep its footprint small.
+
+The limits are applied here rather than in a preexec_fn of the server's
+Popen: code running between fork and exec in a threaded server can
+deadlock on locks held by other threads.
+"""
+import os
+import resource
+import sys
+
+
+def find_executable(name):
+    """Look the program up in PATH while we can still read everything (before switching user)"""
+    if os.sep in name:
+        return name
+    for directory in os.get_exec_path():
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return name
+
+
+def apply_limits(limits):
+    """Set the rlimits given as "<cpu seconds>:<address space>:<file size>:<processes or ->" """
+    cpu_seconds, memory_limit, file_size, max_processes = limits.split(':')
+    cpu_seconds, memory_limit, file_size = int(cpu_seconds), int(memory_limit), int(file_size)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+    if max_processes != '-':
+        resource.setrlimit(resource.RLIMIT_NPROC, (int(max_processes), int(max_processes)))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def main():
+    report_fd = int(sys.argv[1])
+    user = sys.argv[2]
+    limits = sys.argv[3]
+    command = sys.argv[4:]
+    
+    # The program's peak RSS starts at ours, so ours is the floor below
+    # which its own usage cannot be told apart. getrusage would include the
+    # server we were forked from; the peak of our own address space does not.
+    floor = 0
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    floor = int(line.split()[1])
+    except OSError:
+        pass
+    
+    executable = find_executable(command[0])
+    
+    pid = os.fork()
+    if pid == 0:
+        os.close(report_fd)
+        try:
+            # In the child only: the launcher itself must be able to report
+            apply_limits(limits)
+            if user != '-':
+                uid, gid = (int(part) for part in user.split(':'))
+                os.setgroups([])
+                os.setgid(gid)
+                os.setuid(uid)
+            os.execv(executable, command)
+        except OSError as e:
+            os.write(2, f"{command[0]}: {e.strerror}\n".encode())
+        except ValueError as e:
+            os.write(2, f"sandbox limits: {e}\n".encode())
+        os._exit(127)
+    
+    _, status, usage = os.wait4(pid, 0)
+    
+    with os.fdopen(report_fd, 'w') as report:
+        report.write(f"{status} {usage.ru_utime} {usage.ru_stime} {usage.ru_maxrss} {floor}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import logging
+
+from sqlalchemy import UniqueConstraint, func, inspect, select, text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to the current models
+    
+    Creates missing tables, adds missing columns to existing tables and
+    creates missing indexes. Columns added this way are filled with their
+    default (when they have a plain value as default) so existing rows read
+    like newly created ones. Unique constraints added to existing tables
+    are created as unique indexes, after removing duplicate rows (the newest
+    row, by primary key, is kept). Safe to run on every start: anything
+    already present is left alone. Must be called inside an application
+    context.
+    
+    Returns:
+        list: "table.column" of every column added
+    """
+    db.create_all()
+    
+    engine = db.engine
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                if column.default is not None and column.default.is_scalar:
+                    connection.execute(table.update().values({column.name: column.default.arg}))
+                added.append(f'{table.name}.{column.name}')
+        
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+        
+        for table in db.metadata.sorted_tables:
+            unique = {tuple(c['column_names']) for c in inspector.get_unique_constraints(table.name)}
+            unique |= {tuple(i['column_names']) for i in inspector.get_indexes(table.name) if i['unique']}
+            for constraint in table.constraints:
+                columns = [column.name for column in constraint.columns]
+                if not isinstance(constraint, UniqueConstraint) or tuple(columns) in unique:
+                    continue
+                key = list(table.primary_key.columns)[0]
+                newest = select(func.max(key)).group_by(*constraint.columns)
+                removed = connection.execute(table.delete().where(key.not_in(newest))).rowcount
+                if removed:
+                    logger.warning(f"Removed {removed} duplicate rows from {table.name}")
+                connection.execute(text(
+                    f"CREATE UNIQUE INDEX {constraint.name} ON {table.name} ({', '.join(columns)})"
+                ))
+    
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+    return added
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+
+# Keep the tests off the network and out of the instance folder; Config reads
+# these when it is imported
+os.environ.setdefault('RUNTIME_CATALOG_ENABLED', 'False')
+os.environ.setdefault('PISTON_HEALTH_CHECK_INTERVAL', '0')
+os.environ.setdefault('EXECUTION_CACHE_ENABLED', 'False')
+os.environ.setdefault('EXECUTION_RATE_LIMIT_PATH', os.path.join(tempfile.mkdtemp(), 'execution_state.db'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import create_app
+from config import TestingConfig
+from models import db, User
+
+
+class Config(TestingConfig):
+    GRADING_WORKERS = 0
+
+
+@pytest.fixture
+def app():
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin(app):
+    return _create_user('admin', is_admin=True)
+
+
+@pytest.fixture
+def student(app):
+    return _create_user('student')
+
+
+def _create_user(username, is_admin=False):
+    user = User(username=username, email=f'{username}@example.com', is_admin=is_admin)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def login(client):
+    def login(user):
+        return client.post('/auth/login', data={'username': user.username, 'password': 'password'})
+    return login
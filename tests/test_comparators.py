@@ -0,0 +1,97 @@
+import math
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from comparators import COMPARATORS, compare_output, register_comparator
+# Aliased so pytest does not take them for test classes
+from forms import TestCaseForm as CaseForm
+from models import TestCase as CaseModel
+
+
+def case(expected, comparator='exact', abs_tolerance=None, rel_tolerance=None):
+    return CaseModel(expected_output=expected, comparator=comparator,
+                     abs_tolerance=abs_tolerance, rel_tolerance=rel_tolerance)
+
+
+@pytest.mark.parametrize('comparator, actual, expected, message', [
+    ('exact', 'a\nb\nc\n', 'a\nx\nc\n', "Line 2: expected 'x', got 'b'"),
+    ('exact', 'a\n', 'a\nb\n', "output ended early, expected 'b' (line 2 of the expected output)"),
+    ('lines', 'a  \nb\nc\n\n', 'a\nb\n', "Line 3: unexpected extra output 'c'"),
+    ('whitespace', 'a   b\n\nc d\n', 'a b\nc  e\n', "Line 3: expected 'c e', got 'c d'"),
+    ('tokens', '1 2\n3 5', '1\n2 3 4', "Line 2: expected '4', got '5'"),
+])
+def test_mismatch_reports_first_difference(comparator, actual, expected, message):
+    assert str(compare_output(actual, case(expected, comparator))) == message
+
+
+@pytest.mark.parametrize('comparator, actual, expected', [
+    ('exact', '  a\nb\n\n', 'a\nb'),
+    ('lines', 'a \t\nb\n\n\n', 'a\nb\n'),
+    ('whitespace', 'a\t b\n\n', 'a b'),
+    ('tokens', '1\n2\n3\n', '1 2 3'),
+    ('unordered', 'b\na\nb\n', 'b\nb\na\n'),
+])
+def test_accepts_equivalent_output(comparator, actual, expected):
+    assert compare_output(actual, case(expected, comparator)) is None
+
+
+def test_float_default_tolerance():
+    assert compare_output('0.3333334', case('0.3333333', 'float')) is None
+    mismatch = compare_output('x 0.334', case('x 0.333', 'float'))
+    assert str(mismatch) == "Line 1: expected '0.333', got '0.334'"
+
+
+def test_float_zero_tolerance_is_exact():
+    # An explicit 0 must not fall back to the default tolerance
+    assert compare_output('1.0000001', case('1.0', 'float', abs_tolerance=0.0)) is not None
+    assert compare_output('1.00', case('1.0', 'float', abs_tolerance=0.0)) is None
+
+
+def test_float_tolerances():
+    assert compare_output('1.05', case('1.0', 'float', abs_tolerance=0.1)) is None
+    assert compare_output('1.2', case('1.0', 'float', abs_tolerance=0.1)) is not None
+    assert compare_output('1010', case('1000', 'float', rel_tolerance=0.01)) is None
+    assert compare_output('1020', case('1000', 'float', rel_tolerance=0.01)) is not None
+    # Words must match exactly, special values only themselves
+    assert compare_output('yes', case('no', 'float', abs_tolerance=1.0)) is not None
+    assert compare_output('nan inf', case('nan inf', 'float')) is None
+    assert compare_output('inf', case('-inf', 'float', abs_tolerance=1.0)) is not None
+
+
+def test_unordered_reports_extra_and_missing_lines():
+    assert str(compare_output('a\nc\n', case('a\nb\n', 'unordered'))) == "Line 2: unexpected line 'c'"
+    assert str(compare_output('a\n', case('a\nb\n', 'unordered'))) == "missing line 'b'"
+    assert str(compare_output('a\na\n', case('a\n', 'unordered'))) == "Line 2: unexpected line 'a'"
+
+
+def test_registered_comparator_is_used(monkeypatch):
+    # Removed from the registry again after the test
+    monkeypatch.setitem(COMPARATORS, 'anything', None)
+    register_comparator('anything', lambda actual, expected, test_case: None)
+    assert compare_output('whatever', case('expected', 'anything')) is None
+    # Unknown names fall back to exact comparison
+    assert compare_output('a', case('b', 'missing')) is not None
+
+
+@pytest.mark.parametrize('field, value', [
+    ('abs_tolerance', '-0.1'),
+    ('abs_tolerance', 'nan'),
+    ('rel_tolerance', 'inf'),
+    ('rel_tolerance', 'abc'),
+    ('comparator', 'missing'),
+])
+def test_form_rejects_bad_settings(app, field, value):
+    data = {'expected_output': '1', 'order': '1', 'comparator': 'float', field: value}
+    with app.test_request_context():
+        form = CaseForm(formdata=MultiDict(data))
+        assert not form.validate()
+        assert field in form.errors
+
+
+def test_form_accepts_tolerances(app):
+    data = {'expected_output': '1', 'order': '1', 'comparator': 'float', 'abs_tolerance': '0', 'rel_tolerance': '1e-9'}
+    with app.test_request_context():
+        form = CaseForm(formdata=MultiDict(data))
+        assert form.validate(), form.errors
+        assert form.abs_tolerance.data == 0 and math.isclose(form.rel_tolerance.data, 1e-9)
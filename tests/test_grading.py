@@ -0,0 +1,105 @@
+import pytest
+
+from grading import GradingWorker, enqueue_grading, grade_code_submission
+from models import db, GradingJob, Question, QuestionSubmission, Quiz, Submission
+# Aliased so pytest does not take the models for test classes
+from models import TestCase as CaseModel, TestResult as ResultModel
+from utils import PistonAPI
+
+
+@pytest.fixture
+def answer(admin, student):
+    """A committed code answer to a question with one visible and one hidden test case"""
+    quiz = Quiz(title='Quiz', author_id=admin.id)
+    db.session.add(quiz)
+    db.session.flush()
+    question = Question(quiz_id=quiz.id, title='Echo', problem_statement='Print the input',
+                        question_type='code', language='python', points=10, order=0)
+    db.session.add(question)
+    db.session.flush()
+    for i in range(2):
+        db.session.add(CaseModel(question_id=question.id, input_data=str(i), expected_output=str(i),
+                                 is_hidden=i == 1, order=i))
+    submission = Submission(user_id=student.id, quiz_id=quiz.id)
+    db.session.add(submission)
+    db.session.flush()
+    answer = QuestionSubmission(submission_id=submission.id, question_id=question.id,
+                                code='print(input())', language='python')
+    db.session.add(answer)
+    db.session.commit()
+    return answer
+
+
+@pytest.fixture
+def executions(monkeypatch):
+    """Replaces the code runner; records whether a write transaction was open during each execution"""
+    write_open = []
+    
+    def run_test_cases(language, code, test_cases, **kwargs):
+        write_open.append(db.session.connection().connection.dbapi_connection.in_transaction)
+        return [{'passed': True, 'output': tc.expected_output, 'error': '', 'execution_time': 0.01}
+                for tc in test_cases]
+    
+    monkeypatch.setattr(PistonAPI, 'run_test_cases', staticmethod(run_test_cases))
+    return write_open
+
+
+def test_no_write_transaction_while_grading_code(answer, executions):
+    grade_code_submission(answer, visible_only=True)
+    db.session.commit()
+    
+    # A resubmission: the stored code changed since the last grading
+    answer.code = 'print(input().strip())'
+    db.session.commit()
+    grade_code_submission(answer)
+    db.session.commit()
+    
+    assert executions == [False, False]
+    assert ResultModel.query.filter_by(question_submission_id=answer.id).count() == 2
+
+
+def test_no_write_transaction_while_grading_worker_runs_code(app, answer, executions):
+    enqueue_grading(answer)
+    db.session.commit()
+    
+    assert GradingWorker(app).process_next()
+    assert executions == [False]
+    assert GradingJob.query.one().status == GradingJob.DONE
+
+
+def test_worker_does_not_claim_a_job_while_another_grades_the_same_answer(app, answer, executions):
+    enqueue_grading(answer)
+    db.session.commit()
+    worker = GradingWorker(app)
+    running = worker.claim_next()
+    
+    # Resubmitted while the first job is still running
+    enqueue_grading(answer)
+    db.session.commit()
+    assert worker.claim_next() is None
+    
+    worker.process(running)
+    assert worker.process_next()
+    # The code did not change, so the second job reuses the first one's results
+    assert executions == [False]
+    assert [job.status for job in GradingJob.query.order_by(GradingJob.id)] == [GradingJob.DONE, GradingJob.DONE]
+    assert ResultModel.query.filter_by(question_submission_id=answer.id).count() == 2
+
+
+def test_question_scores_nothing_until_hidden_tests_have_run(app, client, login, student, answer, executions):
+    grade_code_submission(answer, visible_only=True)
+    enqueue_grading(answer)
+    db.session.commit()
+    login(student)
+    url = f'/api/submissions/{answer.submission_id}/grading-status'
+    
+    # Only the visible test has run: no score yet, rather than full marks
+    assert answer.score == 0
+    status = client.get(url).get_json()['answers'][str(answer.id)]
+    assert status['pending'] and status['score'] is None
+    
+    assert GradingWorker(app).process_next()
+    db.session.expire_all()
+    assert answer.score == 10
+    status = client.get(url).get_json()['answers'][str(answer.id)]
+    assert not status['pending'] and status['score'] == 10
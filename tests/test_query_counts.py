@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from models import db, GradingJob, Question, QuestionOption, QuestionSubmission, Quiz, SelectedOption, Submission
+# Aliased so pytest does not take the models for test classes
+from models import TestCase as CaseModel, TestResult as ResultModel
+
+
+@contextmanager
+def count_queries():
+    """Count the statements sent to the database inside the block"""
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def create_graded_submission(admin, student, question_count):
+    """A completed submission answering every question of a new quiz, code and multiple choice alternating"""
+    quiz = Quiz(title=f'Quiz with {question_count} questions', author_id=admin.id)
+    db.session.add(quiz)
+    db.session.flush()
+    
+    submission = Submission(user_id=student.id, quiz_id=quiz.id, is_completed=True, completed_at=datetime.utcnow())
+    db.session.add(submission)
+    db.session.flush()
+    
+    for order in range(question_count):
+        is_code = order % 2 == 0
+        question = Question(quiz_id=quiz.id, title=f'Question {order}', problem_statement='Solve it',
+                            question_type='code' if is_code else 'multiple_choice',
+                            language='python' if is_code else None, points=10, order=order)
+        db.session.add(question)
+        db.session.flush()
+        
+        answer = QuestionSubmission(submission_id=submission.id, question_id=question.id, score=5)
+        db.session.add(answer)
+        db.session.flush()
+        
+        if is_code:
+            answer.code = 'print(input())'
+            answer.language = 'python'
+            for i in range(3):
+                test_case = CaseModel(question_id=question.id, input_data=str(i), expected_output=str(i),
+                                      is_hidden=i == 2, order=i)
+                db.session.add(test_case)
+                db.session.flush()
+                db.session.add(ResultModel(question_submission_id=answer.id, test_case_id=test_case.id,
+                                           output=str(i), passed=True, execution_time=0.01))
+        else:
+            options = [QuestionOption(question_id=question.id, text=f'Option {i}', is_correct=i == 0, order=i)
+                       for i in range(4)]
+            db.session.add_all(options)
+            db.session.flush()
+            db.session.add(SelectedOption(question_submission_id=answer.id, option_id=options[0].id))
+    
+    submission.calculate_score()
+    db.session.commit()
+    return submission
+
+
+def queries_for(client, url):
+    # Nothing loaded by an earlier request may spare this one a query
+    db.session.expire_all()
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('view', ['student', 'admin'])
+def test_submission_view_query_count_does_not_grow_with_questions(client, login, admin, student, view):
+    small = create_graded_submission(admin, student, 2)
+    large = create_graded_submission(admin, student, 10)
+    
+    if view == 'student':
+        login(student)
+        url = '/student/submissions/{}'
+    else:
+        login(admin)
+        url = '/admin/submission/{}'
+    
+    assert queries_for(client, url.format(small.id)) == queries_for(client, url.format(large.id))
+
+
+def test_grading_status_query_count_does_not_grow_with_answers(client, login, admin, student):
+    small = create_graded_submission(admin, student, 2)
+    large = create_graded_submission(admin, student, 10)
+    for submission in (small, large):
+        for answer in submission.question_submissions.filter(QuestionSubmission.language.isnot(None)):
+            # An older finished job and the current one
+            db.session.add(GradingJob(question_submission_id=answer.id, status=GradingJob.DONE))
+            db.session.add(GradingJob(question_submission_id=answer.id))
+    db.session.commit()
+    login(student)
+    
+    url = '/api/submissions/{}/grading-status'
+    assert queries_for(client, url.format(small.id)) == queries_for(client, url.format(large.id))
+    assert client.get(url.format(large.id)).get_json()['pending'] == 5
+
+
+def test_results_list_query_count_does_not_grow_with_submissions(client, login, admin, student):
+    login(student)
+    create_graded_submission(admin, student, 2)
+    few = queries_for(client, '/student/results')
+    
+    for _ in range(5):
+        create_graded_submission(admin, student, 2)
+    assert queries_for(client, '/student/results') == few
+
+
+def test_dashboard_query_count_does_not_grow_with_submissions(client, login, admin, student):
+    login(admin)
+    create_graded_submission(admin, student, 2)
+    few = queries_for(client, '/admin/dashboard')
+    
+    for _ in range(5):
+        create_graded_submission(admin, student, 10)
+    assert queries_for(client, '/admin/dashboard') == few
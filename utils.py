@@ -1,18 +1,1382 @@
 import requests
+import copy
 import json
+import re
 import time
 import logging
 import os
 import bleach
+import hashlib
+import random
+import sqlite3
+import threading
+from requests.adapters import HTTPAdapter
 from functools import lru_cache
 import secrets
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Import configuration 
 from config import Config
+from preflight import check_syntax
+from comparators import compare_output
 
 logger = logging.getLogger(__name__)
 
+def connect_shared_sqlite(local, path, schema):
+    """
+    Return this thread's connection to a SQLite file shared between workers
+    
+    Args:
+        local (threading.local): Per-thread storage owned by the caller
+        path (str): Database file path
+        schema (list): Statements run once when the connection is opened
+    """
+    # sqlite3 connections must not be shared between threads
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in schema:
+            conn.execute(statement)
+        local.conn = conn
+    return conn
+
+class ExecutionCache:
+    """
+    Persistent, content-addressed cache of successful execution results.
+    
+    Entries live in a SQLite file so every worker on the node shares them and
+    they survive restarts. The cache is bounded by the total size of the
+    stored results and evicts the least recently used entries first; entries
+    older than the TTL are never returned.
+    """
+    
+    def __init__(self, path, max_bytes, ttl):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS execution_cache ('
+        ' key TEXT PRIMARY KEY,'
+        ' value BLOB NOT NULL,'
+        ' size INTEGER NOT NULL,'
+        ' created_at REAL NOT NULL,'
+        ' accessed_at REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_execution_cache_accessed_at ON execution_cache (accessed_at)'
+    ]
+    
+    def _connect(self):
+        return connect_shared_sqlite(self._local, self.path, self.SCHEMA)
+    
+    @staticmethod
+    def make_key(language, version, code, stdin, compile_timeout, run_timeout):
+        """Return the content hash identifying one execution"""
+        # Length-prefixed parts, hashed in place rather than serialized first
+        digest = hashlib.sha256()
+        for part in (language, version, code, stdin, str(compile_timeout), str(run_timeout)):
+            data = part.encode('utf-8')
+            digest.update(f"{len(data)}:".encode('ascii'))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def is_cacheable(result):
+        """Only deterministic outcomes are cached - never API errors or timeouts"""
+        if not result.get('success'):
+            return False
+        # A stage killed by a signal or for exceeding its time limit (Piston
+        # reports status "TO") may well finish on a less loaded backend - the
+        # compile stage as much as the run
+        for stage in ('compile', 'run'):
+            outcome = result.get(stage) or {}
+            if outcome.get('signal') or outcome.get('status') == 'TO':
+                return False
+        return True
+    
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT value FROM execution_cache WHERE key = ? AND created_at > ?',
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE execution_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Execution cache read failed: {str(e)}")
+            return None
+    
+    def set(self, key, result):
+        """Store a result if it is cacheable, evicting old entries as needed"""
+        if not self.is_cacheable(result):
+            return
+        
+        value = json.dumps(result).encode('utf-8')
+        if len(value) > self.max_bytes:
+            return
+        
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO execution_cache (key, value, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value), now, now)
+            )
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Execution cache write failed: {str(e)}")
+    
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM execution_cache WHERE created_at <= ?', (now - self.ttl,))
+        
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM execution_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        # Drop least recently used entries until we are back under the byte budget
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute('SELECT key, size FROM execution_cache ORDER BY accessed_at'):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany('DELETE FROM execution_cache WHERE key = ?', victims)
+
+
+_execution_cache = None
+_execution_cache_lock = threading.Lock()
+
+def get_execution_cache():
+    """Return the shared execution cache, or None if caching is disabled"""
+    global _execution_cache
+    if not Config.EXECUTION_CACHE_ENABLED:
+        return None
+    
+    with _execution_cache_lock:
+        if _execution_cache is None:
+            _execution_cache = ExecutionCache(
+                Config.EXECUTION_CACHE_PATH,
+                Config.EXECUTION_CACHE_MAX_BYTES,
+                Config.EXECUTION_CACHE_TTL
+            )
+    return _execution_cache
+
+class SingleFlight:
+    """
+    Coalesces identical executions that are in flight at the same time.
+    
+    The first caller for a key (the leader) executes; concurrent callers in
+    the same process wait for it and get a copy of its result. Across worker
+    processes the leader also takes a short lease in the shared SQLite state
+    file, and leaders in other processes wait for the result to appear in
+    the shared execution cache instead of executing again. Waiting is bounded
+    by max_wait; after that a caller executes on its own.
+    """
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS inflight ('
+        ' key TEXT PRIMARY KEY,'
+        ' token TEXT NOT NULL,'
+        ' expires_at REAL NOT NULL)'
+    ]
+    POLL_INTERVAL = 0.05  # seconds between cache checks while another worker executes
+    
+    def __init__(self, path, max_wait, cache=None):
+        self.path = path
+        self.max_wait = max_wait
+        self.cache = cache  # cross-worker coalescing needs the shared cache
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flights = {}
+    
+    def do(self, key, fn):
+        """
+        Return fn()'s result, sharing one call between concurrent callers with the same key
+        
+        Args:
+            key (str): Execution key (see ExecutionCache.make_key)
+            fn (callable): Performs the execution
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {'done': threading.Event(), 'result': None}
+        
+        if not leader:
+            if flight['done'].wait(self.max_wait) and flight['result'] is not None:
+                result = copy.deepcopy(flight['result'])
+                result['coalesced'] = True
+                return result
+            return fn()
+        
+        try:
+            flight['result'] = self._lead(key, fn)
+            return flight['result']
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight['done'].set()
+    
+    def _lead(self, key, fn):
+        """Execute for this process, unless another worker is already executing the same key"""
+        if self.cache is None:
+            return fn()
+        
+        token = secrets.token_hex(8)
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while not self._try_lease(key, token):
+                if time.monotonic() >= deadline:
+                    return fn()
+                time.sleep(self.POLL_INTERVAL)
+                result = self.cache.get(key)
+                if result is not None:
+                    result['coalesced'] = True
+                    return result
+        except sqlite3.Error as e:
+            logger.warning(f"Execution coalescing unavailable: {str(e)}")
+            return fn()
+        
+        try:
+            return fn()
+        finally:
+            self._release_lease(key, token)
+    
+    def _try_lease(self, key, token):
+        conn = connect_shared_sqlite(self._local, self.path, self.SCHEMA)
+        now = time.time()
+        conn.execute('DELETE FROM inflight WHERE key = ? AND expires_at < ?', (key, now))
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO inflight (key, token, expires_at) VALUES (?, ?, ?)',
+            (key, token, now + self.max_wait)
+        )
+        return cursor.rowcount == 1
+    
+    def _release_lease(self, key, token):
+        try:
+            conn = connect_shared_sqlite(self._local, self.path, self.SCHEMA)
+            conn.execute('DELETE FROM inflight WHERE key = ? AND token = ?', (key, token))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not release execution lease: {str(e)}")
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Return the execution coalescer, or None if coalescing is disabled"""
+    global _single_flight
+    if not Config.EXECUTION_COALESCING_ENABLED:
+        return None
+    
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(
+                Config.EXECUTION_RATE_LIMIT_PATH,
+                Config.EXECUTION_COALESCING_MAX_WAIT,
+                get_execution_cache()
+            )
+    return _single_flight
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by every worker on the node.
+    
+    Bucket state (tokens, last refill time) lives in one SQLite row per key
+    and is refilled lazily on each check, so a check is O(1). Callers that
+    find the bucket empty wait for the next token instead of failing, but
+    only up to a deadline and only while fewer than max_waiters threads of
+    this process are already waiting.
+    """
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS rate_limit_bucket ('
+        ' key TEXT PRIMARY KEY,'
+        ' tokens REAL NOT NULL,'
+        ' updated_at REAL NOT NULL)'
+    ]
+    
+    def __init__(self, path, rate_per_minute, burst, max_wait, max_waiters):
+        self.path = path
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.burst = burst
+        self.max_wait = max_wait
+        self._local = threading.local()
+        self._waiters = threading.BoundedSemaphore(max_waiters)
+    
+    def _connect(self):
+        return connect_shared_sqlite(self._local, self.path, self.SCHEMA)
+    
+    def _take(self, key):
+        """
+        Try to take one token
+        
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_bucket WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                tokens = float(self.burst)
+            else:
+                tokens = min(float(self.burst), row[0] + max(0.0, now - row[1]) * self.rate)
+            
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limit_bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def acquire(self, key='default'):
+        """
+        Take a token for key, waiting up to max_wait seconds for one
+        
+        Returns:
+            bool: True if a token was taken, False if the deadline passed or
+                  too many callers are already waiting
+        """
+        try:
+            wait = self._take(key)
+        except sqlite3.Error as e:
+            # Never block executions because the limiter store is unavailable
+            logger.warning(f"Rate limiter unavailable: {str(e)}")
+            return True
+        if wait == 0:
+            return True
+        
+        if not self._waiters.acquire(blocking=False):
+            logger.warning(f"Rate limit wait queue full for {key}")
+            return False
+        
+        try:
+            deadline = time.monotonic() + self.max_wait
+            while time.monotonic() + wait <= deadline:
+                time.sleep(wait)
+                try:
+                    wait = self._take(key)
+                except sqlite3.Error as e:
+                    logger.warning(f"Rate limiter unavailable: {str(e)}")
+                    return True
+                if wait == 0:
+                    return True
+            return False
+        finally:
+            self._waiters.release()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Return the shared execution rate limiter"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                Config.EXECUTION_RATE_LIMIT_PATH,
+                Config.EXECUTION_RATE_LIMIT,
+                Config.EXECUTION_RATE_LIMIT_BURST,
+                Config.EXECUTION_RATE_LIMIT_MAX_WAIT,
+                Config.EXECUTION_RATE_LIMIT_MAX_WAITERS
+            )
+    return _rate_limiter
+
+class SchedulerBusyError(Exception):
+    """Raised when an execution cannot be scheduled (queue full or wait deadline passed)"""
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by backend latency and errors.
+    
+    Every completed execution is a sample. A fast, successful sample raises
+    the limit by 1/limit (about +1 per limit's worth of executions); a failed
+    sample (timeout, connection error, 5xx) or one slower than the latency
+    target cuts it multiplicatively, at most once per second so a single
+    burst of slow responses is not punished repeatedly.
+    """
+    
+    def __init__(self, initial, min_limit, max_limit, latency_target, backoff=0.7, window=500):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._decreased_at = 0
+        self.samples = 0
+        self.errors = 0
+    
+    def record(self, latency, ok=True):
+        """
+        Record one execution
+        
+        Args:
+            latency (float): Seconds the backend took for one run
+            ok (bool): False if the backend failed (not the student's program)
+        """
+        with self._lock:
+            self.samples += 1
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.errors += 1
+            
+            if not ok or latency > self.latency_target:
+                now = time.monotonic()
+                if now - self._decreased_at >= 1:
+                    self._decreased_at = now
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+    
+    @property
+    def current(self):
+        """Whole number of executions currently allowed in flight"""
+        return max(self.min_limit, int(self.limit))
+    
+    def percentiles(self):
+        """p50/p90/p99 of recent successful latencies, in seconds"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99)}
+
+
+class ExecutionScheduler:
+    """
+    Admission control in front of the execution backend.
+    
+    At most limit.current executions run at once in this process, where the
+    limit adapts to backend latency (see AdaptiveLimit). Waiting executions
+    are served strictly by priority class (final grading before interactive
+    "Run code" requests) and, within a class, round-robin across owners
+    (students), so one student's queued runs cannot starve others.
+    Interactive callers may only have max_queued_per_owner runs waiting, and
+    are turned away immediately when the expected wait already exceeds
+    their deadline.
+    
+    Per-class queue depth and wait times, the current limit and latency
+    percentiles are published to SQLite tables so admins can see the state
+    of every worker process on the node.
+    """
+    
+    GRADING = 'grading'
+    INTERACTIVE = 'interactive'
+    PRIORITIES = (GRADING, INTERACTIVE)  # highest priority first
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS scheduler_stats ('
+        ' pid INTEGER NOT NULL,'
+        ' priority TEXT NOT NULL,'
+        ' queued INTEGER NOT NULL,'
+        ' running INTEGER NOT NULL,'
+        ' avg_wait REAL NOT NULL,'
+        ' max_wait REAL NOT NULL,'
+        ' completed INTEGER NOT NULL,'
+        ' updated_at REAL NOT NULL,'
+        ' PRIMARY KEY (pid, priority))',
+        'CREATE TABLE IF NOT EXISTS limiter_stats ('
+        ' pid INTEGER PRIMARY KEY,'
+        ' concurrency_limit REAL NOT NULL,'
+        ' in_flight INTEGER NOT NULL,'
+        ' p50 REAL NOT NULL,'
+        ' p90 REAL NOT NULL,'
+        ' p99 REAL NOT NULL,'
+        ' samples INTEGER NOT NULL,'
+        ' errors INTEGER NOT NULL,'
+        ' updated_at REAL NOT NULL)'
+    ]
+    STATS_STALE_AFTER = 60  # seconds
+    
+    def __init__(self, limit, max_queued_per_owner, max_wait, stats_path):
+        self.limit = limit  # AdaptiveLimit
+        self.max_queued_per_owner = max_queued_per_owner
+        self.max_wait = max_wait  # {priority: seconds}
+        self.stats_path = stats_path
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._running = {p: 0 for p in self.PRIORITIES}
+        # priority -> OrderedDict(owner -> deque of waiting tickets)
+        self._queues = {p: OrderedDict() for p in self.PRIORITIES}
+        self._queued = {p: 0 for p in self.PRIORITIES}
+        self._waits = {p: deque(maxlen=200) for p in self.PRIORITIES}
+        self._completed = {p: 0 for p in self.PRIORITIES}
+        self._published_at = 0
+    
+    def _next_ticket(self):
+        for priority in self.PRIORITIES:
+            owners = self._queues[priority]
+            if not owners:
+                continue
+            owner, tickets = next(iter(owners.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                owners.move_to_end(owner)  # round-robin between owners
+            else:
+                del owners[owner]
+            self._queued[priority] -= 1
+            return ticket
+        return None
+    
+    def _dispatch(self):
+        while sum(self._running.values()) < self.limit.current:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket['granted'] = True
+            self._running[ticket['priority']] += 1
+            self._waits[ticket['priority']].append(time.monotonic() - ticket['queued_at'])
+        self._cond.notify_all()
+    
+    def acquire(self, priority, owner=None, deadline=None):
+        """
+        Wait for an execution slot
+        
+        Args:
+            priority (str): Priority class
+            owner: Who the execution is for, for fair queuing
+            deadline (float): time.time() after which the result is useless
+                              (e.g. the quiz time limit); waiting stops there
+        
+        Raises:
+            SchedulerBusyError: If the owner already has too many runs queued
+                                or no slot freed up before the class deadline
+        """
+        if deadline is not None and deadline <= time.time():
+            raise SchedulerBusyError('The time limit passed before this code could run.')
+        
+        with self._cond:
+            owners = self._queues[priority]
+            if priority == self.INTERACTIVE and len(owners.get(owner, ())) >= self.max_queued_per_owner:
+                raise SchedulerBusyError('Too many code runs in progress. Please wait for your previous run to finish.')
+            if priority == self.INTERACTIVE and self._expected_wait(priority) > self.max_wait[priority]:
+                # Shed now rather than make the student wait for a timeout
+                raise SchedulerBusyError('The code execution queue is busy. Please try again shortly.')
+            
+            ticket = {'priority': priority, 'queued_at': time.monotonic(), 'granted': False}
+            owners.setdefault(owner, deque()).append(ticket)
+            self._queued[priority] += 1
+            self._dispatch()
+            
+            max_wait = self.max_wait[priority]
+            if deadline is not None:
+                max_wait = min(max_wait, deadline - time.time())
+            wait_until = ticket['queued_at'] + max_wait
+            while not ticket['granted']:
+                remaining = wait_until - time.monotonic()
+                if remaining <= 0:
+                    owners[owner].remove(ticket)
+                    if not owners[owner]:
+                        del owners[owner]
+                    self._queued[priority] -= 1
+                    self._publish()
+                    raise SchedulerBusyError('The code execution queue is busy. Please try again shortly.')
+                self._cond.wait(remaining)
+            self._publish()
+    
+    def _expected_wait(self, priority):
+        """Rough wait for a new ticket: the work queued ahead of it, drained limit at a time"""
+        ahead = sum(self._queued[p] for p in self.PRIORITIES[:self.PRIORITIES.index(priority) + 1])
+        if ahead == 0:
+            return 0.0
+        return ahead / self.limit.current * self.limit.percentiles()['p50']
+    
+    def record(self, latency, ok=True):
+        """Feed an execution's latency to the adaptive limit and admit more work if it grew"""
+        self.limit.record(latency, ok)
+        with self._cond:
+            self._dispatch()
+    
+    def release(self, priority):
+        with self._cond:
+            self._running[priority] -= 1
+            self._completed[priority] += 1
+            self._dispatch()
+            self._publish()
+    
+    @contextmanager
+    def slot(self, priority, owner=None, deadline=None):
+        """Hold an execution slot for the duration of the with block"""
+        self.acquire(priority, owner, deadline)
+        try:
+            yield
+        finally:
+            self.release(priority)
+    
+    def stats(self):
+        """Queue depth, running count and wait times per priority class for this process"""
+        with self._cond:
+            return {
+                p: {
+                    'queued': self._queued[p],
+                    'running': self._running[p],
+                    'avg_wait': sum(self._waits[p]) / len(self._waits[p]) if self._waits[p] else 0.0,
+                    'max_wait': max(self._waits[p]) if self._waits[p] else 0.0,
+                    'completed': self._completed[p]
+                }
+                for p in self.PRIORITIES
+            }
+    
+    def limiter_stats(self):
+        """Current concurrency limit, executions in flight and latency percentiles for this process"""
+        stats = {
+            'limit': round(self.limit.limit, 2),
+            'in_flight': sum(self._running.values()),
+            'samples': self.limit.samples,
+            'errors': self.limit.errors
+        }
+        stats.update(self.limit.percentiles())
+        return stats
+    
+    def _publish(self):
+        """Write this process's stats to the shared store (called with the lock held)"""
+        now = time.time()
+        idle = not any(self._queued.values()) and not any(self._running.values())
+        # Throttle writes, but always record the moment we go idle
+        if now - self._published_at < 1 and not idle:
+            return
+        self._published_at = now
+        
+        rows = []
+        for p in self.PRIORITIES:
+            waits = self._waits[p]
+            rows.append((
+                os.getpid(), p, self._queued[p], self._running[p],
+                sum(waits) / len(waits) if waits else 0.0,
+                max(waits) if waits else 0.0,
+                self._completed[p], now
+            ))
+        limiter = self.limiter_stats()
+        try:
+            conn = connect_shared_sqlite(self._local, self.stats_path, self.SCHEMA)
+            conn.executemany('INSERT OR REPLACE INTO scheduler_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute(
+                'INSERT OR REPLACE INTO limiter_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (os.getpid(), limiter['limit'], limiter['in_flight'], limiter['p50'], limiter['p90'],
+                 limiter['p99'], limiter['samples'], limiter['errors'], now)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish scheduler stats: {str(e)}")
+    
+    def node_stats(self):
+        """Stats per priority class aggregated over every live worker process on the node"""
+        totals = {p: {'queued': 0, 'running': 0, 'avg_wait': 0.0, 'max_wait': 0.0, 'completed': 0, 'workers': 0}
+                  for p in self.PRIORITIES}
+        try:
+            conn = connect_shared_sqlite(self._local, self.stats_path, self.SCHEMA)
+            rows = conn.execute(
+                'SELECT priority, queued, running, avg_wait, max_wait, completed FROM scheduler_stats '
+                'WHERE updated_at > ?',
+                (time.time() - self.STATS_STALE_AFTER,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read scheduler stats: {str(e)}")
+            rows = [(p, s['queued'], s['running'], s['avg_wait'], s['max_wait'], s['completed'])
+                    for p, s in self.stats().items()]
+        
+        for priority, queued, running, avg_wait, max_wait, completed in rows:
+            if priority not in totals:
+                continue
+            entry = totals[priority]
+            entry['queued'] += queued
+            entry['running'] += running
+            entry['avg_wait'] += avg_wait
+            entry['max_wait'] = max(entry['max_wait'], max_wait)
+            entry['completed'] += completed
+            entry['workers'] += 1
+        
+        for entry in totals.values():
+            if entry['workers']:
+                entry['avg_wait'] /= entry['workers']
+        return totals
+
+    def node_limiter_stats(self):
+        """
+        Concurrency limits and latency percentiles over every live worker on the node
+        
+        Limits and in-flight counts are summed; percentiles are the worst
+        reported by any worker.
+        """
+        totals = {'limit': 0.0, 'in_flight': 0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0,
+                  'samples': 0, 'errors': 0, 'workers': 0}
+        try:
+            conn = connect_shared_sqlite(self._local, self.stats_path, self.SCHEMA)
+            rows = conn.execute(
+                'SELECT concurrency_limit, in_flight, p50, p90, p99, samples, errors FROM limiter_stats '
+                'WHERE updated_at > ?',
+                (time.time() - self.STATS_STALE_AFTER,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read limiter stats: {str(e)}")
+            stats = self.limiter_stats()
+            rows = [(stats['limit'], stats['in_flight'], stats['p50'], stats['p90'], stats['p99'],
+                     stats['samples'], stats['errors'])]
+        
+        for limit, in_flight, p50, p90, p99, samples, errors in rows:
+            totals['limit'] += limit
+            totals['in_flight'] += in_flight
+            totals['p50'] = max(totals['p50'], p50)
+            totals['p90'] = max(totals['p90'], p90)
+            totals['p99'] = max(totals['p99'], p99)
+            totals['samples'] += samples
+            totals['errors'] += errors
+            totals['workers'] += 1
+        return totals
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return this process's execution scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExecutionScheduler(
+                AdaptiveLimit(
+                    Config.EXECUTION_INITIAL_CONCURRENT,
+                    Config.EXECUTION_MIN_CONCURRENT,
+                    Config.EXECUTION_MAX_CONCURRENT,
+                    Config.EXECUTION_LATENCY_TARGET
+                ),
+                Config.EXECUTION_MAX_QUEUED_PER_STUDENT,
+                {
+                    ExecutionScheduler.GRADING: Config.EXECUTION_GRADING_MAX_WAIT,
+                    ExecutionScheduler.INTERACTIVE: Config.EXECUTION_INTERACTIVE_MAX_WAIT
+                },
+                Config.EXECUTION_RATE_LIMIT_PATH
+            )
+    return _scheduler
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the backend while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a backend is unhealthy.
+    
+    After failure_threshold consecutive failures the breaker opens and every
+    call is rejected for reset_timeout seconds. It then lets a single trial
+    call through (half-open); success closes it again, failure re-opens it.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self.recovered_at = 0  # monotonic time the breaker last closed after being open
+        self._lock = threading.Lock()
+    
+    def is_available(self):
+        """Whether a request would currently be let through (without claiming a trial)"""
+        with self._lock:
+            return self.state == self.CLOSED or (
+                self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout
+            )
+    
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let one trial request probe the backend
+                self.state = self.HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker closed")
+                self.recovered_at = time.monotonic()
+            self.state = self.CLOSED
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"Circuit breaker opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class PistonClient:
+    """
+    Shared HTTP client for the Piston backend.
+    
+    Keeps a pool of keep-alive connections, retries idempotent failures
+    (connection errors and 429/502/503/504 responses) with jittered
+    exponential backoff and trips a circuit breaker when the backend keeps
+    failing.
+    """
+    
+    RETRY_STATUSES = {429, 502, 503, 504}
+    
+    def __init__(self, base_url, pool_size, max_retries, backoff, backoff_max,
+                 failure_threshold, reset_timeout):
+        self.base_url = base_url.rstrip('/')
+        self.outstanding = 0  # requests currently in flight to this backend
+        self.runtimes = None  # languages installed on the backend, once probed
+        self.catalog = []  # the backend's last /runtimes response
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        
+        self._outstanding_lock = threading.Lock()
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: spreads retries from many workers instead of synchronising them
+        delay = min(self.backoff_max, self.backoff * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+    
+    def post(self, path, payload, timeout):
+        """
+        POST a JSON payload to the backend
+        
+        Args:
+            path (str): Path below the API base URL, e.g. '/execute'
+            payload (dict): JSON request body
+            timeout (float): Per-attempt request timeout in seconds
+            
+        Returns:
+            requests.Response: The final response
+            
+        Raises:
+            CircuitOpenError: If the backend is considered unhealthy
+            requests.exceptions.RequestException: If every attempt failed
+        """
+        with self._outstanding_lock:
+            self.outstanding += 1
+        try:
+            return self._post(path, payload, timeout)
+        finally:
+            with self._outstanding_lock:
+                self.outstanding -= 1
+    
+    def _post(self, path, payload, timeout):
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError('Code execution service is temporarily unavailable')
+            
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout)
+            except requests.exceptions.ReadTimeout:
+                # The backend accepted the job but is too slow - retrying would only pile on
+                self.breaker.record_failure()
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Piston connection failed, retrying (attempt {attempt + 1})")
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                logger.warning(f"Piston returned {response.status_code}, retrying (attempt {attempt + 1})")
+            
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def probe(self, timeout):
+        """
+        Health-check the backend by fetching its runtime list
+        
+        Updates the circuit breaker and the set of installed languages.
+        
+        Returns:
+            bool: Whether the backend answered
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/runtimes", timeout=timeout)
+            response.raise_for_status()
+            runtimes = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Health check failed for {self.base_url}: {str(e)}")
+            self.breaker.record_failure()
+            return False
+        
+        languages = set()
+        for runtime in runtimes:
+            languages.add(runtime.get('language'))
+            languages.update(runtime.get('aliases') or [])
+        self.runtimes = languages
+        self.catalog = runtimes
+        self.breaker.record_success()
+        return True
+    
+    def supports(self, language):
+        """Whether the backend has the language installed (assumed until probed)"""
+        return self.runtimes is None or language in self.runtimes
+
+
+class PistonPool:
+    """
+    Spreads executions over several Piston backends.
+    
+    Each request goes to the available backend with the fewest outstanding
+    requests relative to its weight, among those that have the language
+    installed. A backend whose circuit breaker is open is ejected; once a
+    health probe or trial request succeeds it is brought back with a weight
+    that ramps up over slow_start seconds. A background thread probes every
+    backend's /runtimes endpoint every health_interval seconds.
+    """
+    
+    def __init__(self, clients, health_interval, probe_timeout, slow_start):
+        self.clients = clients
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self.slow_start = slow_start
+        self._prober = None
+        self._lock = threading.Lock()
+    
+    def start_health_checks(self):
+        """Start the background health prober once"""
+        with self._lock:
+            if self._prober is not None or self.health_interval <= 0:
+                return
+            self._prober = threading.Thread(target=self._probe_forever, name='piston-health', daemon=True)
+            self._prober.start()
+    
+    def _probe_forever(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.health_interval)
+    
+    def probe_all(self):
+        for client in self.clients:
+            client.probe(self.probe_timeout)
+    
+    def _weight(self, client):
+        """Relative capacity; a backend that just recovered starts low and ramps up"""
+        if self.slow_start <= 0 or not client.breaker.recovered_at:
+            return 1.0
+        elapsed = time.monotonic() - client.breaker.recovered_at
+        return min(1.0, 0.1 + 0.9 * elapsed / self.slow_start)
+    
+    def _choose(self, language, exclude):
+        candidates = [c for c in self.clients if c not in exclude and c.breaker.is_available()]
+        # Prefer backends known to have the runtime, but don't fail if none report it
+        installed = [c for c in candidates if c.supports(language)]
+        candidates = installed or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: (c.outstanding + 1) / self._weight(c))
+    
+    def post(self, path, payload, timeout, language=None):
+        """
+        POST a JSON payload to the best available backend
+        
+        Backends that cannot be reached or answer with a server error are
+        skipped in favour of the next best one.
+        
+        Raises:
+            CircuitOpenError: If no backend is available
+            requests.exceptions.RequestException: If every backend failed
+        """
+        tried = []
+        while True:
+            client = self._choose(language, tried)
+            if client is None:
+                raise CircuitOpenError('Code execution service is temporarily unavailable')
+            tried.append(client)
+            last = len(tried) == len(self.clients)
+            
+            try:
+                response = client.post(path, payload, timeout)
+            except requests.exceptions.ReadTimeout:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, CircuitOpenError):
+                if last:
+                    raise
+                logger.warning(f"Piston backend {client.base_url} failed, trying another")
+                continue
+            
+            if response.status_code < 500 or last:
+                return response
+            logger.warning(f"Piston backend {client.base_url} returned {response.status_code}, trying another")
+    
+    def fetch_runtimes(self):
+        """
+        Probe every backend and return the union of their runtime lists
+        
+        Raises:
+            CircuitOpenError: If no backend answered
+        """
+        runtimes = {}
+        for client in self.clients:
+            if client.probe(self.probe_timeout):
+                for runtime in client.catalog:
+                    runtimes[(runtime.get('language'), runtime.get('version'))] = runtime
+        if not any(c.runtimes is not None for c in self.clients):
+            raise CircuitOpenError('No code execution backend answered')
+        return list(runtimes.values())
+    
+    def status(self):
+        """Per-backend health, load and weight, for monitoring"""
+        return [
+            {
+                'url': c.base_url,
+                'state': c.breaker.state,
+                'outstanding': c.outstanding,
+                'weight': round(self._weight(c), 2),
+                'runtimes': sorted(c.runtimes) if c.runtimes is not None else None
+            }
+            for c in self.clients
+        ]
+
+
+_piston_client = None
+_piston_client_lock = threading.Lock()
+
+def get_piston_client():
+    """Return the shared pool of Piston backends for this worker, health checks started on first use"""
+    global _piston_client
+    with _piston_client_lock:
+        if _piston_client is None:
+            _piston_client = PistonPool(
+                [
+                    PistonClient(
+                        url,
+                        pool_size=Config.PISTON_POOL_SIZE,
+                        max_retries=Config.PISTON_MAX_RETRIES,
+                        backoff=Config.PISTON_RETRY_BACKOFF,
+                        backoff_max=Config.PISTON_RETRY_BACKOFF_MAX,
+                        failure_threshold=Config.PISTON_BREAKER_FAILURE_THRESHOLD,
+                        reset_timeout=Config.PISTON_BREAKER_RESET_TIMEOUT
+                    )
+                    for url in Config.PISTON_API_URLS
+                ],
+                health_interval=Config.PISTON_HEALTH_CHECK_INTERVAL,
+                probe_timeout=Config.PISTON_HEALTH_CHECK_TIMEOUT,
+                slow_start=Config.PISTON_SLOW_START
+            )
+            _piston_client.start_health_checks()
+    return _piston_client
+
+def _version_key(version):
+    """Sort key ordering version strings numerically ('3.10.0' > '3.9.4')"""
+    return [int(part) if part.isdigit() else -1 for part in re.split(r'[.\-+]', version)]
+
+class RuntimeCatalog:
+    """
+    The runtimes (language and version) installed on the execution backend.
+    
+    The catalog is fetched from the backend's /runtimes endpoint and
+    refreshed in the background every refresh_interval seconds. The last
+    fetch is stored in the shared SQLite state file, so on a node only one
+    worker per interval actually asks the backend; the others load its copy.
+    Configured language versions are resolved against the catalog, so a
+    backend runtime upgrade does not break executions.
+    """
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS runtime_catalog ('
+        ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+        ' runtimes TEXT NOT NULL,'
+        ' fetched_at REAL NOT NULL)'
+    ]
+    
+    def __init__(self, path, refresh_interval, fetch):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.fetch = fetch  # callable returning a Piston /runtimes list
+        self.fetched_at = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._versions = None  # language or alias -> available versions, newest first
+        self._resolved = {}
+        self._thread = None
+    
+    def load(self, runtimes, fetched_at):
+        versions = {}
+        for runtime in runtimes:
+            for name in [runtime.get('language')] + list(runtime.get('aliases') or []):
+                versions.setdefault(name, set()).add(runtime.get('version'))
+        with self._lock:
+            self._versions = {
+                name: sorted(found, key=_version_key, reverse=True) for name, found in versions.items()
+            }
+            self._resolved = {}
+            self.fetched_at = fetched_at
+    
+    def refresh(self):
+        """Load the shared copy if it is fresh, otherwise fetch from the backend and share it"""
+        conn = connect_shared_sqlite(self._local, self.path, self.SCHEMA)
+        row = conn.execute('SELECT runtimes, fetched_at FROM runtime_catalog WHERE id = 1').fetchone()
+        if row is not None and time.time() - row[1] < self.refresh_interval:
+            if row[1] != self.fetched_at:
+                self.load(json.loads(row[0]), row[1])
+            return
+        
+        runtimes = self.fetch()
+        fetched_at = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO runtime_catalog (id, runtimes, fetched_at) VALUES (1, ?, ?)',
+            (json.dumps(runtimes), fetched_at)
+        )
+        self.load(runtimes, fetched_at)
+        logger.info(f"Runtime catalog refreshed: {len(runtimes)} runtimes")
+    
+    def start(self):
+        """Fetch the catalog in the background now and then every refresh_interval seconds"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_forever, name='runtime-catalog', daemon=True)
+            self._thread.start()
+    
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous catalog (or configured versions) until the backend is back
+                logger.warning(f"Could not refresh runtime catalog: {str(e)}")
+            time.sleep(min(self.refresh_interval, 60) if self._versions is None else self.refresh_interval)
+    
+    @property
+    def loaded(self):
+        return self._versions is not None
+    
+    def resolve(self, language, configured):
+        """
+        Resolve a configured version to one the backend has installed
+        
+        Prefers the exact version, then the newest version sharing the
+        longest leading part (e.g. '3.10' -> '3.10.4', '18.12.1' -> '18.x'),
+        then the newest version of the language.
+        
+        Returns:
+            str: The version to request, the configured one if the catalog has
+                 not been loaded yet, or None if the language is not installed
+        """
+        with self._lock:
+            if self._versions is None:
+                return configured
+            if language in self._resolved:
+                return self._resolved[language]
+            available = self._versions.get(language)
+        
+        version = None
+        if available:
+            # Configured versions may carry a runtime prefix, e.g. 'gcc-11.2.0'
+            wanted = re.sub(r'^[^\d]*', '', configured or '')
+            version = wanted if wanted in available else available[0]
+            parts = wanted.split('.')
+            for length in range(len(parts), 0, -1):
+                matches = [v for v in available if v.split('.')[:length] == parts[:length]]
+                if matches:
+                    version = wanted if wanted in matches else matches[0]
+                    break
+            if version != configured:
+                logger.info(f"Resolved {language} {configured} to installed version {version}")
+        
+        with self._lock:
+            self._resolved[language] = version
+        return version
+
+
+_runtime_catalog = None
+_runtime_catalog_lock = threading.Lock()
+
+def get_runtime_catalog():
+    """
+    Return the backend runtime catalog, starting its background refresh
+    
+    Called on first use (the first execution), so CLI commands, shells and
+    tests that never run code start no background threads.
+    
+    Returns None when the catalog is disabled or the local backend is used
+    (its runtimes are whatever is installed on this host).
+    """
+    global _runtime_catalog
+    if not Config.RUNTIME_CATALOG_ENABLED or Config.CODE_EXECUTION_BACKEND != 'piston':
+        return None
+    
+    with _runtime_catalog_lock:
+        if _runtime_catalog is None:
+            _runtime_catalog = RuntimeCatalog(
+                Config.EXECUTION_RATE_LIMIT_PATH,
+                Config.RUNTIME_CATALOG_REFRESH_INTERVAL,
+                lambda: get_piston_client().fetch_runtimes()
+            )
+            _runtime_catalog.start()
+    return _runtime_catalog
+
+def resolve_language_version(language):
+    """
+    Version of a supported language to request from the backend
+    
+    Returns:
+        str: The installed version, or None if the backend does not have the language
+    """
+    configured = Config.SUPPORTED_LANGUAGES[language]['version']
+    catalog = get_runtime_catalog()
+    if catalog is None:
+        return configured
+    return catalog.resolve(language, configured)
+
+class PistonExecutor:
+    """Execution backend that runs code on the remote Piston API"""
+    
+    @property
+    def max_run_timeout(self):
+        """Largest run_timeout (ms) the backend accepts"""
+        return Config.PISTON_MAX_RUN_TIMEOUT
+    
+    def execute(self, language, payload):
+        """
+        Send an execution payload to the Piston API
+        
+        Args:
+            language (str): Programming language (used for logging)
+            payload (dict): Piston /execute request body
+            
+        Returns:
+            dict: API response containing execution results
+        """
+        try:
+            start_time = time.time()
+            
+            # Make request with timeout over the shared connection pool
+            timeout = Config.PISTON_API_TIMEOUT
+            response = get_piston_client().post('/execute', payload, timeout, language=language)
+            
+            end_time = time.time()
+            execution_time = end_time - start_time
+            
+            if response.status_code == 200:
+                result = response.json()
+                result['execution_time'] = execution_time
+                result['success'] = True
+                
+                # Check for execution errors
+                if 'run' in result and 'code' in result['run'] and result['run']['code'] != 0:
+                    # Program executed but with non-zero exit code
+                    logger.warning(f"Code execution returned non-zero exit code: {result['run']['code']}")
+                
+                return result
+            else:
+                error_msg = f'API error: {response.status_code}'
+                try:
+                    error_data = response.json()
+                    if 'message' in error_data:
+                        error_msg = f"API error: {error_data['message']}"
+                except:
+                    pass
+                
+                logger.error(error_msg)
+                return {
+                    'success': False,
+                    'error': error_msg,
+                    # The backend rejected the request itself (bad payload, unknown
+                    # language), which says nothing about its health
+                    'request_error': 400 <= response.status_code < 500 and response.status_code != 429
+                }
+                
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        except requests.exceptions.Timeout:
+            logger.error(f"API timeout while executing {language} code")
+            return {
+                'success': False,
+                'error': 'API request timed out'
+            }
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request error: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Request error: {str(e)}'
+            }
+        except Exception as e:
+            logger.error(f"Unexpected error executing code: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Unexpected error: {str(e)}'
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """
+    Return the execution backend selected by Config.CODE_EXECUTION_BACKEND
+    
+    Every backend exposes execute(language, payload), takes a Piston
+    /execute payload and returns a Piston-style result dict.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            backend = Config.CODE_EXECUTION_BACKEND
+            if backend == 'local':
+                from sandbox import LocalExecutor
+                _executor = LocalExecutor()
+            elif backend == 'piston':
+                _executor = PistonExecutor()
+            else:
+                raise ValueError(f'Unknown code execution backend: {backend}')
+    return _executor
+
 class PistonAPI:
     """
     A utility class for interacting with the Piston API to run code in various languages.
@@ -20,38 +1384,19 @@ class PistonAPI:
     
     This enhanced version includes:
     - Better error handling
-    - Timeouts and retries
+    - Timeouts, retries and a circuit breaker (see PistonClient)
     - Input sanitization
     - Response caching
     - Rate limiting
     """
     
-    # Track API calls to implement rate limiting
-    _api_calls = {}
-    _rate_limit = 60  # calls per minute
-    
     @classmethod
     def _check_rate_limit(cls, key='default'):
-        """Check if we've hit the rate limit"""
-        now = time.time()
-        
-        # Initialize or clean old data
-        if key not in cls._api_calls:
-            cls._api_calls[key] = []
-        else:
-            # Remove calls older than 1 minute
-            cls._api_calls[key] = [t for t in cls._api_calls[key] if t > now - 60]
-        
-        # Check if under rate limit
-        if len(cls._api_calls[key]) < cls._rate_limit:
-            cls._api_calls[key].append(now)
-            return True
-        
-        return False
+        """Take an execution token, waiting briefly if the shared limit is reached"""
+        return get_rate_limiter().acquire(key)
     
     @staticmethod
-    @lru_cache(maxsize=128)  # Cache results for identical inputs
-    def execute_code(language, code, stdin=""):
+    def execute_code(language, code, stdin="", priority=ExecutionScheduler.GRADING, owner=None, deadline=None):
         """
         Execute code using the Piston API
         
@@ -59,6 +1404,9 @@ class PistonAPI:
             language (str): Programming language (python, c, java, etc.)
             code (str): Source code to execute
             stdin (str): Input to pass to the program
+            priority (str): Scheduler class (ExecutionScheduler.GRADING or INTERACTIVE)
+            owner: Who the execution is for (student id), for fair queuing
+            deadline (float): time.time() after which the run is no longer wanted
             
         Returns:
             dict: API response containing execution results
@@ -69,23 +1417,74 @@ class PistonAPI:
                 'error': f'Language {language} is not supported'
             }
         
-        # Check rate limit
-        if not PistonAPI._check_rate_limit(language):
+        # Reject runtimes the backend doesn't have without a round-trip
+        version = resolve_language_version(language)
+        if version is None:
             return {
                 'success': False,
-                'error': 'Rate limit exceeded. Please try again later.'
+                'error': f'Language {language} is not available on the code execution service'
             }
         
-        language_config = Config.SUPPORTED_LANGUAGES[language]
+        # Code that does not even parse is answered without a round-trip
+        syntax_error = check_syntax(language, code, get_filename_for_language(language), version)
+        if syntax_error is not None:
+            return PistonAPI._preflight_result(language, version, syntax_error)
         
-        url = f"{Config.PISTON_API_URL}/execute"
+        # Input goes to the program exactly as given, within the size cap
+        stdin, stdin_error = prepare_stdin(stdin)
+        if stdin_error:
+            return {
+                'success': False,
+                'error': stdin_error
+            }
+        
+        # Identical executions are served from the shared result cache
+        cache = get_execution_cache()
+        cache_key = PistonAPI._cache_key(language, version, code, stdin)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cached['cached'] = True
+                return cached
         
-        # Sanitize stdin to prevent injection
-        stdin = bleach.clean(stdin) if stdin else ""
+        # Concurrent identical runs (e.g. everyone running the starter code
+        # at the start of an exam) share a single execution
+        single_flight = get_single_flight()
+        if single_flight is not None:
+            return single_flight.do(
+                cache_key,
+                lambda: PistonAPI._execute_uncached(language, version, code, stdin, cache, cache_key,
+                                                   priority, owner, deadline)
+            )
+        return PistonAPI._execute_uncached(language, version, code, stdin, cache, cache_key,
+                                           priority, owner, deadline)
+    
+    @staticmethod
+    def _preflight_result(language, version, error):
+        """A compile failure found by the local pre-flight check, shaped like a backend one"""
+        return {
+            'success': True,
+            'language': language,
+            'version': version,
+            'compile': {'stdout': '', 'stderr': error, 'output': error, 'code': 1, 'signal': None},
+            'run': {'stdout': '', 'stderr': '', 'output': '', 'code': None, 'signal': None},
+            'execution_time': 0,
+            'preflight': True
+        }
+    
+    @staticmethod
+    def _execute_uncached(language, version, code, stdin, cache, cache_key, priority, owner, deadline=None):
+        """Rate limit, execute on the backend and store the result in the cache"""
+        # Check rate limit
+        if not PistonAPI._check_rate_limit(language):
+            return {
+                'success': False,
+                'error': 'Rate limit exceeded. Please try again later.'
+            }
         
         payload = {
             "language": language,
-            "version": language_config['version'],
+            "version": version,
             "files": [
                 {
                     "name": get_filename_for_language(language),
@@ -100,63 +1499,203 @@ class PistonAPI:
             "run_memory_limit": -1
         }
         
-        try:
-            start_time = time.time()
-            
-            # Make request with timeout
-            timeout = Config.PISTON_API_TIMEOUT
-            response = requests.post(url, json=payload, timeout=timeout)
-            
-            end_time = time.time()
-            execution_time = end_time - start_time
+        result = PistonAPI._send_execute(language, payload, priority, owner, deadline=deadline)
+        if cache is not None:
+            cache.set(cache_key, result)
+        return result
+    
+    @staticmethod
+    def _cache_key(language, version, code, stdin):
+        """Return the result cache key for running code on an already validated stdin"""
+        return ExecutionCache.make_key(
+            language,
+            version,
+            code,
+            stdin,
+            Config.CODE_COMPILE_TIMEOUT,
+            Config.CODE_EXECUTION_TIMEOUT
+        )
+    
+    @staticmethod
+    def _send_execute(language, payload, priority=ExecutionScheduler.GRADING, owner=None, runs=1, deadline=None):
+        """
+        Run an execution payload on the configured backend
+        
+        Args:
+            language (str): Programming language (used for logging)
+            payload (dict): Piston /execute request body
+            priority (str): Scheduler class the execution is queued in
+            owner: Who the execution is for, for fair queuing
+            runs (int): Number of program runs in the payload (batch executions)
+            deadline (float): time.time() after which the execution is not started
             
-            if response.status_code == 200:
-                result = response.json()
-                result['execution_time'] = execution_time
-                result['success'] = True
-                
-                # Check for execution errors
-                if 'run' in result and 'code' in result['run'] and result['run']['code'] != 0:
-                    # Program executed but with non-zero exit code
-                    logger.warning(f"Code execution returned non-zero exit code: {result['run']['code']}")
-                
+        Returns:
+            dict: Piston-style response containing execution results
+        """
+        scheduler = get_scheduler()
+        try:
+            with scheduler.slot(priority, owner, deadline):
+                start_time = time.monotonic()
+                result = get_executor().execute(language, payload)
+                if not result.get('request_error'):
+                    # Latency per run, so batches are judged like single runs
+                    scheduler.record((time.monotonic() - start_time) / max(runs, 1), result['success'])
                 return result
-            else:
-                error_msg = f'API error: {response.status_code}'
-                try:
-                    error_data = response.json()
-                    if 'message' in error_data:
-                        error_msg = f"API error: {error_data['message']}"
-                except:
-                    pass
-                
-                logger.error(error_msg)
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"API timeout while executing {language} code")
-            return {
-                'success': False,
-                'error': 'API request timed out'
-            }
-        except requests.exceptions.RequestException as e:
-            logger.error(f"API request error: {str(e)}")
+        except SchedulerBusyError as e:
             return {
                 'success': False,
-                'error': f'Request error: {str(e)}'
+                'error': str(e)
             }
-        except Exception as e:
-            logger.error(f"Unexpected error executing code: {str(e)}")
-            return {
-                'success': False,
-                'error': f'Unexpected error: {str(e)}'
+    
+    @staticmethod
+    def execute_batch(language, code, stdins, owner=None, deadline=None):
+        """
+        Execute code against several inputs in a single Piston request
+        
+        The program and every input are shipped to a per-language harness
+        (see harnesses/) which compiles the program once and runs it once per
+        input. The harness reads a record count line from stdin followed by
+        one "<byte length>\\n<bytes>" record for the source and for each input.
+        It writes a "compile <code> <stderr length>" header followed by the
+        compiler output, then one
+        "run <code> <signal> <ms> <stdout length> <stderr length>" header per
+        input followed by the raw stdout and stderr bytes. Harnesses that can
+        measure it append "<cpu ms> <peak RSS KB>" to the run header.
+        
+        Args:
+            language (str): Programming language (python, c, java, etc.)
+            code (str): Source code to execute
+            stdins (list): Inputs to pass to the program, one run each
+            owner: Who the execution is for (student id), for fair queuing
+            deadline (float): time.time() after which the batch is not started
+            
+        Returns:
+            list: One execute_code-style result per input, or None if the
+                  language has no batch harness or the batch could not be run
+        """
+        harness = get_batch_harness(language)
+        if harness is None or not stdins:
+            return None
+        
+        version = resolve_language_version(language)
+        if version is None:
+            return None
+        
+        syntax_error = check_syntax(language, code, get_filename_for_language(language), version)
+        if syntax_error is not None:
+            return [PistonAPI._preflight_result(language, version, syntax_error) for _ in stdins]
+        
+        # Inputs are validated exactly as execute_code does; any bad one is
+        # reported by the per-test-case fallback
+        prepared = [prepare_stdin(stdin) for stdin in stdins]
+        if any(error for _, error in prepared):
+            return None
+        stdins = [stdin for stdin, _ in prepared]
+        
+        # Serve what we can from the result cache and only batch the misses
+        cache = get_execution_cache()
+        cache_keys = [PistonAPI._cache_key(language, version, code, stdin) for stdin in stdins]
+        results = [None] * len(stdins)
+        if cache is not None:
+            for i, cache_key in enumerate(cache_keys):
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    cached['cached'] = True
+                    results[i] = cached
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        if not PistonAPI._check_rate_limit(language):
+            return None
+        
+        # Framed as text (lengths in UTF-8 bytes) so each input is copied once
+        records = [code]
+        records.extend(stdins[i] for i in missing)
+        framed = [f"{len(records)}\n"]
+        for record in records:
+            framed.append(f"{utf8_size(record)}\n")
+            framed.append(record)
+        
+        run_timeout = Config.CODE_EXECUTION_TIMEOUT * 1000
+        # The harness compiles the program and runs every input inside the run
+        # stage. Backends cap that stage, so a batch whose worst case would not
+        # fit runs under the cap instead: programs that finish quickly are all
+        # judged in one request, and a batch the cap cuts short falls back to
+        # one request per test case below.
+        batch_timeout = Config.CODE_COMPILE_TIMEOUT * 1000 + run_timeout * len(missing)
+        max_run_timeout = get_executor().max_run_timeout
+        if max_run_timeout is not None:
+            batch_timeout = min(batch_timeout, max_run_timeout)
+            run_timeout = min(run_timeout, max_run_timeout)
+        payload = {
+            "language": language,
+            "version": version,
+            "files": [
+                {
+                    "name": get_filename_for_language(language),
+                    "content": harness
+                }
+            ],
+            "stdin": "".join(framed),
+            "args": [str(run_timeout)],
+            "compile_timeout": Config.CODE_COMPILE_TIMEOUT * 1000,
+            "run_timeout": batch_timeout,
+            "compile_memory_limit": -1,
+            "run_memory_limit": -1
+        }
+        
+        result = PistonAPI._send_execute(language, payload, ExecutionScheduler.GRADING, owner, len(missing), deadline)
+        if not result['success']:
+            logger.warning(f"Batch execution failed for {language}: {result.get('error')}")
+            return None
+        
+        harness_run = result.get('run', {})
+        if harness_run.get('code') != 0 or result.get('compile', {}).get('code', 0) != 0:
+            logger.warning(f"Batch harness for {language} exited abnormally: {harness_run.get('stderr', '')[:200]}")
+            return None
+        
+        try:
+            compile_result, runs = parse_batch_output(harness_run.get('stdout', ''))
+        except ValueError as e:
+            logger.warning(f"Could not parse batch output for {language}: {str(e)}")
+            return None
+        
+        if compile_result['code'] != 0:
+            # Compilation failed - every input gets the same compile error
+            runs = [{'stdout': '', 'stderr': '', 'code': None, 'signal': None, 'time': 0,
+                     'cpu_time': None, 'memory': None}] * len(missing)
+        elif len(runs) != len(missing):
+            logger.warning(f"Batch output for {language} has {len(runs)} runs, expected {len(missing)}")
+            return None
+        
+        for i, run in zip(missing, runs):
+            results[i] = {
+                'success': True,
+                'language': result.get('language', language),
+                'version': result.get('version', version),
+                'compile': compile_result,
+                'run': {
+                    'stdout': run['stdout'],
+                    'stderr': run['stderr'],
+                    'output': run['stdout'] + run['stderr'],
+                    'code': run['code'],
+                    'signal': run['signal'],
+                    # Piston units: milliseconds and bytes
+                    'wall_time': int(run['time'] * 1000),
+                    'cpu_time': run['cpu_time'],
+                    'memory': run['memory'] * 1024 if run['memory'] is not None else None
+                },
+                'execution_time': run['time']
             }
+            if cache is not None:
+                cache.set(cache_keys[i], results[i])
+        
+        return results
     
     @staticmethod
-    def run_test_case(language, code, test_case):
+    def run_test_case(language, code, test_case, owner=None, deadline=None):
         """
         Run a test case against provided code
         
@@ -164,10 +1703,15 @@ class PistonAPI:
             language (str): Programming language
             code (str): Source code
             test_case (TestCase): Test case model instance
+            owner: Who the execution is for (student id), for fair queuing
+            deadline (float): time.time() after which the test case is not run
             
         Returns:
             dict: Test execution result
         """
+        if deadline is not None and time.time() >= deadline:
+            return PistonAPI._deadline_result()
+        
         # Validate inputs
         if not code or not language:
             return {
@@ -177,27 +1721,54 @@ class PistonAPI:
                 'execution_time': 0
             }
         
-        result = PistonAPI.execute_code(language, code, test_case.input_data or "")
+        result = PistonAPI.execute_code(language, code, test_case.input_data or "", owner=owner, deadline=deadline)
+        if not result['success'] and deadline is not None and time.time() >= deadline:
+            # Dropped from the execution queue when the deadline passed
+            return PistonAPI._deadline_result()
+        return PistonAPI.evaluate_test_case(result, test_case)
+    
+    @staticmethod
+    def _deadline_result():
+        return {
+            'passed': False,
+            'output': None,
+            'error': 'Not graded: the quiz time limit passed before this test case ran',
+            'execution_time': 0,
+            'deadline_exceeded': True
+        }
+    
+    @staticmethod
+    def evaluate_test_case(result, test_case):
+        """
+        Grade an execution result against a test case
         
+        Args:
+            result (dict): Result returned by execute_code or execute_batch
+            test_case (TestCase): Test case model instance
+            
+        Returns:
+            dict: Test execution result
+        """
         if not result['success']:
             return {
                 'passed': False,
                 'output': None,
                 'error': result.get('error', 'Unknown error'),
-                'execution_time': 0
+                'execution_time': 0,
+                'execution_failed': True
             }
         
-        # Clean output (remove trailing newlines)
-        expected_output = test_case.expected_output.strip()
-        actual_output = result.get('run', {}).get('stdout', '').strip()
+        stdout = result.get('run', {}).get('stdout', '')
+        actual_output = stdout.strip()
         error_output = result.get('run', {}).get('stderr', '')
+        usage = PistonAPI._run_usage(result)
         
         # Check for compilation error
         if result.get('compile', {}).get('stderr'):
             return {
                 'passed': False,
                 'output': None,
-                'error': result['compile']['stderr'],
+                'error': truncate_output(result['compile']['stderr']),
                 'execution_time': result.get('execution_time', 0),
                 'compile_error': True
             }
@@ -206,20 +1777,341 @@ class PistonAPI:
         if result.get('run', {}).get('code', 0) != 0:
             return {
                 'passed': False,
-                'output': actual_output,
-                'error': error_output or f"Program exited with code {result['run']['code']}",
-                'execution_time': result.get('execution_time', 0),
-                'runtime_error': True
+                'output': truncate_output(actual_output),
+                # Killed for running too long is reported against the budget
+                'error': truncate_output(PistonAPI._check_budgets(usage, test_case) or error_output
+                                         or f"Program exited with code {result['run']['code']}"),
+                'runtime_error': True,
+                **usage
             }
         
-        passed = actual_output == expected_output and not error_output
+        # Compared in full with the test case's comparator; only what is
+        # stored is truncated
+        mismatch = compare_output(stdout, test_case)
+        passed = mismatch is None and not error_output
+        
+        # The verdict can be re-judged later from what is stored only if that
+        # is all of the output; stripping the end of it never matters
+        stored_output = truncate_output(actual_output)
+        output_judged = not error_output and stored_output == actual_output and not stdout[:1].isspace()
+        
+        # A correct answer still fails if it is over the test case's budgets
+        budget_error = PistonAPI._check_budgets(usage, test_case) if passed else None
+        if budget_error:
+            return {
+                'passed': False,
+                'output': stored_output,
+                'error': budget_error,
+                'budget_exceeded': True,
+                'output_judged': output_judged,
+                **usage
+            }
         
         return {
             'passed': passed,
-            'output': actual_output,
-            'error': error_output,
-            'execution_time': result.get('execution_time', 0)
+            'output': stored_output,
+            # Say where a wrong answer first goes wrong, unless stderr explains more
+            'error': truncate_output(error_output) or (str(mismatch) if mismatch else error_output),
+            'output_judged': output_judged,
+            **usage
+        }
+    
+    @staticmethod
+    def rejudge_test_result(test_result, test_case):
+        """
+        Re-judge a stored result against the current test case without running the code again
+        
+        Only valid where test_result.can_rejudge() holds: the comparator and the
+        budgets are applied to the stored output and resource usage, as
+        evaluate_test_case would have applied them to the live run.
+        
+        Returns:
+            dict: passed and error, as evaluate_test_case reports them
+        """
+        output = test_result.output or ''
+        mismatch = compare_output(output, test_case)
+        if mismatch is not None:
+            return {'passed': False, 'error': str(mismatch)}
+        usage = {
+            'execution_time': test_result.execution_time,
+            'cpu_time': test_result.cpu_time,
+            'peak_memory': test_result.peak_memory
+        }
+        budget_error = PistonAPI._check_budgets(usage, test_case)
+        return {'passed': budget_error is None, 'error': budget_error or ''}
+    
+    @staticmethod
+    def truncate_result(result):
+        """Truncate the stage outputs of an execution result for display, in place"""
+        for stage in ('compile', 'run'):
+            stage_result = result.get(stage)
+            if stage_result:
+                for stream in ('stdout', 'stderr', 'output'):
+                    if stage_result.get(stream):
+                        stage_result[stream] = truncate_output(stage_result[stream])
+        return result
+    
+    @staticmethod
+    def _run_usage(result):
+        """
+        Resource usage of the program's run stage
+        
+        Piston (and the local backend) report run times in ms and memory in
+        bytes; older Piston versions report neither, in which case every value
+        is None (unmeasured). The request round-trip is not used instead: it
+        includes the network, queueing and compilation.
+        """
+        run = result.get('run', {})
+        wall_time = run.get('wall_time')
+        cpu_time = run.get('cpu_time')
+        memory = run.get('memory')
+        return {
+            'execution_time': wall_time / 1000 if wall_time is not None else None,
+            'cpu_time': cpu_time / 1000 if cpu_time is not None else None,
+            'peak_memory': memory // 1024 if memory is not None else None
         }
+    
+    @staticmethod
+    def _check_budgets(usage, test_case):
+        """
+        Return an error message if the run exceeded a budget of the test case, else None
+        
+        A budget whose usage the backend did not measure is not applied.
+        """
+        if test_case.time_limit:
+            # CPU time where the backend reports it, wall time otherwise
+            used = usage['cpu_time'] if usage['cpu_time'] is not None else usage['execution_time']
+            if used is not None and used > test_case.time_limit:
+                return f"Time limit exceeded: used {used:.3f}s, the limit is {test_case.time_limit:g}s"
+        if test_case.memory_limit and usage['peak_memory'] is not None:
+            if usage['peak_memory'] > test_case.memory_limit * 1024:
+                return (f"Memory limit exceeded: used {usage['peak_memory'] / 1024:.1f} MB, "
+                        f"the limit is {test_case.memory_limit} MB")
+        return None
+    
+    @staticmethod
+    def run_test_cases(language, code, test_cases, owner=None,
+                       stop_on_compile_error=False, stop_on_failure=False, deadline=None):
+        """
+        Run several test cases against the same code
+        
+        Languages with a batch harness compile once and run every test case
+        in a single execution; otherwise (or if the batch fails) the test
+        cases are run concurrently, one execution each.
+        
+        With a fail-fast policy the first test case runs on its own, so a
+        compile error stops grading before the rest fan out, and with
+        stop_on_failure the rest run in small waves until one fails. Test
+        cases after the stopping one are not run.
+        
+        Args:
+            language (str): Programming language
+            code (str): Source code
+            test_cases (list): TestCase model instances
+            owner: Who the execution is for (student id), for fair queuing
+            stop_on_compile_error (bool): Stop once the program fails to compile
+            stop_on_failure (bool): Stop after the first failing test case
+            deadline (float): time.time() after which no more test cases are
+                              started; those get a 'deadline_exceeded' result
+            
+        Returns:
+            list: Test execution results, in the same order as test_cases,
+                  with None for test cases that were skipped
+        """
+        if not test_cases:
+            return []
+        if deadline is not None and time.time() >= deadline:
+            return [PistonAPI._deadline_result() for _ in test_cases]
+        
+        if code and Config.CODE_BATCH_EXECUTION:
+            results = PistonAPI.execute_batch(language, code, [tc.input_data or "" for tc in test_cases], owner, deadline)
+            if results is not None:
+                results = [PistonAPI.evaluate_test_case(result, tc) for result, tc in zip(results, test_cases)]
+                return PistonAPI._apply_stop_policy(results, stop_on_compile_error, stop_on_failure)
+        
+        max_workers = min(get_grading_concurrency(language), len(test_cases))
+        run = lambda tc: PistonAPI.run_test_case(language, code, tc, owner, deadline)
+        
+        def run_all(batch):
+            if max_workers <= 1 or len(batch) <= 1:
+                return [run(tc) for tc in batch]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # map() yields results in submission order regardless of completion order
+                return list(executor.map(run, batch))
+        
+        if not (stop_on_compile_error or stop_on_failure):
+            return run_all(test_cases)
+        
+        results = [run(test_cases[0])]
+        while len(results) < len(test_cases) and \
+                PistonAPI._stop_index(results, stop_on_compile_error, stop_on_failure) is None:
+            remaining = test_cases[len(results):]
+            results.extend(run_all(remaining[:max_workers] if stop_on_failure else remaining))
+        
+        results.extend([None] * (len(test_cases) - len(results)))
+        return PistonAPI._apply_stop_policy(results, stop_on_compile_error, stop_on_failure)
+    
+    @staticmethod
+    def _stop_index(results, stop_on_compile_error, stop_on_failure):
+        """Index of the result at which a fail-fast policy stops grading, or None"""
+        for i, result in enumerate(results):
+            if result is None or result.get('deadline_exceeded'):
+                continue
+            if stop_on_compile_error and result.get('compile_error'):
+                return i
+            if stop_on_failure and not result['passed']:
+                return i
+        return None
+    
+    @staticmethod
+    def _apply_stop_policy(results, stop_on_compile_error, stop_on_failure):
+        """Drop (set to None) every result after the one where grading stops"""
+        stop = PistonAPI._stop_index(results, stop_on_compile_error, stop_on_failure)
+        if stop is None:
+            return results
+        return results[:stop + 1] + [None] * (len(results) - stop - 1)
+
+def get_grading_concurrency(language):
+    """Return how many test cases of one submission may run at the same time"""
+    language_config = Config.SUPPORTED_LANGUAGES.get(language, {})
+    return max(1, int(language_config.get('max_concurrency', Config.CODE_GRADING_CONCURRENCY)))
+
+@lru_cache(maxsize=None)
+def get_batch_harness(language):
+    """Return the batch harness source for the given language, or None if it has none"""
+    harness_file = Config.SUPPORTED_LANGUAGES.get(language, {}).get('batch_harness')
+    if not harness_file:
+        return None
+    
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'harnesses', harness_file)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError as e:
+        logger.error(f"Could not load batch harness {path}: {str(e)}")
+        return None
+
+def parse_batch_output(output):
+    """
+    Parse the framed stdout of a batch harness
+    
+    Args:
+        output (str): Harness stdout
+        
+    Returns:
+        tuple: (compile result dict, list of run result dicts; run 'time'
+               is in seconds, 'cpu_time' in ms and 'memory' in KB)
+        
+    Raises:
+        ValueError: If the output does not follow the framing protocol
+    """
+    data = output.encode('utf-8')
+    pos = 0
+    
+    def read_header():
+        nonlocal pos
+        end = data.find(b'\n', pos)
+        if end < 0:
+            raise ValueError('truncated header')
+        fields = data[pos:end].decode('ascii').split()
+        pos = end + 1
+        return fields
+    
+    def read_chunk(length):
+        nonlocal pos
+        if pos + length > len(data):
+            raise ValueError('truncated record')
+        chunk = data[pos:pos + length].decode('utf-8', errors='replace')
+        pos += length
+        return chunk
+    
+    def parse_code(field):
+        return None if field == '-' else int(field)
+    
+    fields = read_header()
+    if len(fields) != 3 or fields[0] != 'compile':
+        raise ValueError('missing compile record')
+    compile_stderr = read_chunk(int(fields[2]))
+    compile_result = {
+        'stdout': '',
+        'stderr': compile_stderr,
+        'output': compile_stderr,
+        'code': int(fields[1]),
+        'signal': None
+    }
+    
+    runs = []
+    while pos < len(data):
+        fields = read_header()
+        if len(fields) not in (6, 8) or fields[0] != 'run':
+            raise ValueError('malformed run record')
+        stdout = read_chunk(int(fields[4]))
+        stderr = read_chunk(int(fields[5]))
+        runs.append({
+            'stdout': stdout,
+            'stderr': stderr,
+            'code': parse_code(fields[1]),
+            'signal': None if fields[2] == '-' else fields[2],
+            'time': int(fields[3]) / 1000,
+            # Only some harnesses measure CPU time (ms) and peak memory (KB)
+            'cpu_time': int(fields[6]) if len(fields) == 8 else None,
+            'memory': int(fields[7]) if len(fields) == 8 else None
+        })
+    
+    return compile_result, runs
+
+def utf8_size(text):
+    """Size of text in bytes once UTF-8 encoded (ASCII text is not encoded to find out)"""
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+def prepare_stdin(stdin):
+    """
+    Validate the input for one program run
+    
+    Input is passed through byte for byte - never escaped or normalized. The
+    backends take text, so bytes must be valid UTF-8.
+    
+    Args:
+        stdin (str or bytes): Program input
+        
+    Returns:
+        tuple: (input text, None) or (None, error message)
+    """
+    if not stdin:
+        return "", None
+    try:
+        if isinstance(stdin, bytes):
+            stdin = stdin.decode('utf-8')
+        size = utf8_size(stdin)
+    except UnicodeError:
+        return None, 'Input is not valid UTF-8 text'
+    
+    limit = Config.CODE_MAX_STDIN_SIZE * 1024
+    if size > limit:
+        return None, f'Input is too large ({size} bytes, the limit is {limit} bytes)'
+    return stdin, None
+
+def truncate_output(text, limit=None):
+    """
+    Cut program output down to a size that is sensible to store and show
+    
+    Args:
+        text (str): stdout, stderr or compiler output
+        limit (int): Maximum size in bytes (default CODE_MAX_OUTPUT_SIZE)
+        
+    Returns:
+        str: text itself if within the limit, else its first limit bytes
+             followed by an "output truncated" marker
+    """
+    limit = Config.CODE_MAX_OUTPUT_SIZE * 1024 if limit is None else limit
+    if not text or len(text) <= limit // 4:
+        return text
+    size = utf8_size(text)
+    if size <= limit:
+        return text
+    # Cut on a character boundary
+    head = text.encode('utf-8')[:limit].decode('utf-8', errors='ignore')
+    return f"{head}\n... output truncated ({size} bytes in total)"
 
 def get_filename_for_language(language):
     """Return appropriate filename for the given language"""